@@ -2,7 +2,8 @@
 Boolean Network Library
 
 """
-import sys, re, os
+import sys, re, os, hashlib
+from collections import OrderedDict
 
 __VERSION__ = '1.2.0-beta'
 
@@ -16,16 +17,56 @@ from . import ruleparser, boolmodel, timemodel, tokenizer
 
 from .tokenizer import modify_states
 
-def Model( text, mode):
-    "Factory function that returns the proper class based on the mode"
+class ModelCache(object):
+    """
+    Keeps the recently built models keyed by the rules and the mode.
+    Hands out independent copies of the cached models, the least 
+    recently used models are evicted when the cache is full.
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.store   = OrderedDict()
+        self.hits    = self.misses = 0
 
-    # the text parameter may be a file that contains the rules
-    if os.path.isfile( text ):
-        text = file(text, 'rt').read()
+    def key(self, text, mode):
+        "Hash of the mode and the rules, ignores comments, empty lines and spacing"
+        lines = [ ' '.join( line.split() ) for line in util.split( text ) ]
+        value = '\n'.join( [ mode ] + lines )
+        return hashlib.sha1( value.encode('utf-8') ).hexdigest()
 
-    # check the validity of modes
-    if mode not in ruleparser.VALID_MODES:
-        util.error( 'mode parameter must be one of %s' % VALID_MODES)
+    def get(self, text, mode):
+        "Returns a new copy of the model built from the text"
+        key = self.key( text, mode )
+        if key in self.store:
+            self.hits += 1
+            self.store.move_to_end( key )
+        else:
+            self.misses += 1
+            model = build( text=text, mode=mode )
+
+            # compile the rules once for all copies
+            if model.layout is not None:
+                model.compile_rules()
+            self.store[key] = model
+            while len(self.store) > self.maxsize:
+                self.store.popitem( last=False )
+
+        return self.store[key].clone()
+
+    def stats(self):
+        "Returns the cache statistics as a dictionary"
+        return dict( hits=self.hits, misses=self.misses, size=len(self.store), maxsize=self.maxsize )
+
+    def clear(self):
+        "Empties the cache and resets the statistics"
+        self.store.clear()
+        self.hits = self.misses = 0
+
+# the cache used by the factory function
+CACHE = ModelCache()
+
+def build( text, mode ):
+    "Returns a new model of the proper class based on the mode"
 
     # setup mode of operation
     if mode == ruleparser.TIME:
@@ -38,6 +79,29 @@ def Model( text, mode):
     else:
         return boolmodel.BoolModel( mode=mode, text=text )
 
+def Model( text, mode, cache=None):
+    """
+    Factory function that returns the proper class based on the mode
+
+    When the cache parameter is True the model is copied from a cached
+    model built from the same rules, a ModelCache instance may also be 
+    passed to be used instead of the default cache.
+    """
+
+    # the text parameter may be a file that contains the rules
+    if os.path.isfile( text ):
+        text = open(text, 'rt').read()
+
+    # check the validity of modes
+    if mode not in ruleparser.VALID_MODES:
+        util.error( 'mode parameter must be one of %s' % ruleparser.VALID_MODES)
+
+    if cache is True:
+        cache = CACHE
+    if cache:
+        return cache.get( text=text, mode=mode )
+    return build( text=text, mode=mode )
+
 def all_nodes ( text ):
     "Returns all the nodes in the text"
     tokens = tokenizer.tokenize( text )
@@ -0,0 +1,431 @@
+"""
+Vectorized simulation of many replicates at once
+
+The engines in this module evaluate each rule over all replicates
+with a single array operation. Internally the node values are kept
+in boolean arrays of shape (nodes, replicates), the trajectories are
+returned as arrays of shape (steps+1, replicates, nodes).
+
+The engines use the default RULE_* functions, models that
+override them need to be simulated with the regular engine.
+
+With tables set the rules that have few inputs are evaluated
+by indexing their truth tables with the packed input values.
+"""
+from itertools import count
+from boolean2 import util, ruleparser, compiler, tokenizer
+
+try:
+    import numpy
+except ImportError as exc:
+    util.error( f"numpy import error : {exc}. Install it from https://numpy.org/" )
+
+def all_states( size ):
+    """
+    Returns all boolean vectors of a given size as an array
+    of shape (2**size, size), the first column is the highest bit.
+    The order is the same as in state.all_initial_states
+
+    >>> all_states( 2 ).astype(int).tolist()
+    [[0, 0], [0, 1], [1, 0], [1, 1]]
+    """
+    codes  = numpy.arange( 2 ** size, dtype=numpy.uint64 )
+    shifts = numpy.arange( size-1, -1, -1, dtype=numpy.uint64 )
+    return ( ( codes[:, None] >> shifts ) & 1 ).astype( bool )
+
+def check_rules( model ):
+    "Verifies that the model can be simulated in vectorized form"
+    if not compiler.uses_defaults( model.parser ):
+        util.error( 'the vectorized engines do not support overridden RULE_* functions' )
+    if model.layout is None:
+        util.error( 'the vectorized engines do not support the %s mode' % model.parser.mode )
+
+class Engine(object):
+    """
+    Base class of the vectorized engines
+
+    The engines provide a stream( values, steps ) method that generates
+    the (replicates, nodes) arrays for each step, starting with the initial 
+    values. The arrays are reused by the engine, copy them if they need to be kept.
+    """
+    def __init__(self, model, seed=None, tables=False):
+        check_rules( model )
+        self.model  = model
+        self.layout = model.layout
+        self.nodes  = model.layout.nodes
+        self.tables = tables
+        self.rng    = numpy.random.default_rng( seed )
+        self.namespace = dict( _random=self.random, _take=numpy.take, _u8=numpy.uint8 )
+
+    def random(self, size):
+        "Random boolean values for the Random state"
+        return self.rng.random( size ) < 0.5
+
+    def expression(self, tree, read='x[%d]'):
+        """
+        Returns the python expression of a tree over the arrays of the 
+        node values, a truth table lookup when tables are enabled
+        """
+        index = self.layout.index
+        if self.tables:
+            result = compiler.truth_table( tree )
+            if result and result[0]:
+                inputs, table = result
+                name = '_table%d' % len(self.namespace)
+                self.namespace[name] = numpy.array( table, dtype=bool )
+                rows = compiler.table_index( [ index[node] for node in inputs ], read=read + '.view(_u8)' )
+                return '_take(%s, %s)' % (name, rows)
+        text, const = compiler.vector_expr( tree, index, read=read )
+        return text
+
+    def compile(self, name, lines):
+        """
+        Compiles updating rules into a function with the (x, out, size) parameters
+        that assigns the new values of the nodes into the rows of out.
+        """
+        index = self.layout.index
+        body  = [ 'def %s(x, out, size):' % name ]
+        for node, tree in compiler.parse_lines( lines ):
+            body.append( '    out[%d] = %s' % (index[node], self.expression( tree )) )
+        body.append( '    return out' )
+        exec( compile( '\n'.join(body), '<%s>' % name, 'exec' ), self.namespace )
+        return self.namespace[name]
+
+    def initial_values(self, count, missing=None, defaults={}):
+        """
+        Returns an array of shape (count, nodes) with initial values
+        produced the same way as the initialize method of the model does.
+        Random initializers are drawn for each replicate separately,
+        the missing function is called for each replicate.
+        """
+        index  = self.layout.index
+        values = numpy.zeros( (self.layout.size, count), dtype=bool )
+        lexer  = tokenizer.get_lexer()
+        size   = count
+        for line in self.model.init_lines:
+            nodes, tree = compiler.parse_init( lexer.tokenize_line( line ) )
+            text, const = compiler.vector_expr( tree, index, read='values[%d]' )
+            value = eval( text, self.namespace, dict( values=values, size=size ) )
+            for node in nodes:
+                values[ index[node] ] = value
+
+        if self.model.uninit_nodes:
+            if not missing:
+                util.error( 'uninitialized nodes: %s' % list(self.model.uninit_nodes) )
+            for node in self.model.uninit_nodes:
+                values[ index[node] ] = [ bool( missing(node) ) for i in range(count) ]
+
+        for node, value in list(defaults.items()):
+            values[ index[node] ] = value
+
+        return values.T
+
+    def initial_states(self, nodes=None):
+        """
+        Returns an array of shape (replicates, nodes) with all combinations
+        of the values of the listed nodes, by default the uninitialized nodes.
+        Other nodes take their values from the first state of the model,
+        so the model needs to be initialized.
+        """
+        if nodes is None:
+            nodes = self.model.uninit_nodes
+        nodes  = list( sorted(nodes) )
+        combos = all_states( len(nodes) )
+        first  = numpy.frombuffer( bytes(self.model.first.data), dtype=numpy.uint8 ).astype( bool )
+        values = numpy.repeat( first[None, :], len(combos), axis=0 )
+        for column, node in enumerate( nodes ):
+            values[:, self.layout.index[node]] = combos[:, column]
+        return values
+
+    def rows(self, values):
+        "Returns the initial values as an array of shape (replicates, nodes)"
+        values = numpy.asarray( values, dtype=bool )
+        if values.ndim == 1:
+            values = values[None, :]
+        if values.shape[1] != self.layout.size:
+            util.error( 'initial values need %d columns, one for each node' % self.layout.size )
+        return values
+
+    def check(self, values):
+        "Returns the (nodes, replicates) working copy of the initial values"
+        return numpy.array( self.rows( values ).T, order='C' )
+
+    def states(self, values):
+        "Converts an array of shape (replicates, nodes) into a list of states"
+        values = numpy.asarray( values, dtype=numpy.uint8 )
+        return [ self.layout.state( bytearray( row.tobytes() ) ) for row in values ]
+
+    def iterate(self, values, steps):
+        """
+        Runs the simulation for all initial values, returns
+        an array of shape (steps+1, replicates, nodes)
+        """
+        values = numpy.asarray( values, dtype=bool )
+        if values.ndim == 1:
+            values = values[None, :]
+        traj = numpy.empty( (steps+1, ) + values.shape, dtype=bool )
+        for step, frame in enumerate( self.stream( values, steps ) ):
+            traj[step] = frame
+        return traj
+
+    def averages(self, values, steps):
+        """
+        Runs the simulation and returns a dictionary keyed by nodes with
+        the fraction of replicates that have the node in the True state
+        at each step, as the Collector does with normalized averages.
+        """
+        total = numpy.empty( (steps+1, self.layout.size) )
+        for step, frame in enumerate( self.stream( values, steps ) ):
+            total[step] = frame.mean( axis=0 )
+        return dict( (node, total[:, index]) for index, node in enumerate(self.nodes) )
+
+class SyncEngine( Engine ):
+    """
+    Vectorized engine for the synchronous and time modes
+
+    >>> from boolean2 import boolmodel
+    >>> model = boolmodel.BoolModel( mode='sync', text='A = True\\n B* = A\\n C* = not B' )
+    >>> model.initialize( missing=util.false )
+    >>> engine = SyncEngine( model )
+    >>> values = engine.initial_states()
+    >>> traj = engine.iterate( values, steps=2 )
+    >>> traj.shape
+    (3, 4, 3)
+    >>> traj[-1].astype(int).tolist()
+    [[1, 1, 0], [1, 1, 0], [1, 1, 0], [1, 1, 0]]
+    """
+    def __init__(self, model, seed=None, tables=False):
+        Engine.__init__( self, model=model, seed=seed, tables=tables )
+
+        mode = model.parser.mode
+        if mode not in ( ruleparser.SYNC, ruleparser.TIME ):
+            util.error( 'the synchronous engine does not support the %s mode' % mode )
+
+        self.time  = ( mode == ruleparser.TIME )
+        self.gcd   = self.time and util.list_gcd( model.ranks + [ 0 ] ) or 1
+        self.funcs = {}
+        for rank in model.ranks:
+            name = '_rank%d' % rank
+            self.funcs[rank] = self.compile( name, model.update_lines[rank] )
+        self.times = [ 0 ]
+
+    def schedule(self):
+        "Generates the ranks that are updated in each step"
+        if not self.time:
+            while 1:
+                yield self.model.ranks
+
+        # in the time mode the ranks are the time delays of the rules
+        for step in count(1):
+            timestep = step * self.gcd
+            ranks = [ rank for rank in self.model.ranks if timestep % rank == 0 ]
+            if ranks:
+                self.times.append( timestep )
+                yield ranks
+
+    def stream(self, values, steps):
+        x   = self.check( values )
+        out = numpy.empty_like( x )
+        size = x.shape[1]
+
+        self.times = [ 0 ]
+        schedule = self.schedule()
+        yield x.T
+        for step in range(steps):
+            # nodes without rules keep their values
+            numpy.copyto( out, x )
+            for rank in next( schedule ):
+                self.funcs[rank]( x, out, size )
+            x, out = out, x
+            yield x.T
+
+class BitEngine( SyncEngine ):
+    """
+    Vectorized engine for the synchronous and time modes that packs 
+    the values of 64 replicates into each word. The values of a node 
+    are stored as an array of uint64 words, bit i of word j belongs 
+    to replicate 64*j+i. The rules are evaluated with bitwise operations 
+    on the words, the truth tables are not used. The padding bits 
+    of the last word are ignored.
+
+    >>> from boolean2 import boolmodel
+    >>> model = boolmodel.BoolModel( mode='sync', text='A = True\\n B* = A\\n C* = not B' )
+    >>> model.initialize( missing=util.false )
+    >>> engine = BitEngine( model )
+    >>> values = engine.initial_values( 100, missing=util.false )
+    >>> engine.pack( values ).shape
+    (3, 2)
+    >>> engine.run( values, steps=2 )[:2].astype(int).tolist()
+    [[1, 1, 0], [1, 1, 0]]
+    """
+    def random(self, size):
+        "Random words for the Random state"
+        return numpy.frombuffer( self.rng.bytes( 8 * size ), dtype=numpy.uint64 )
+
+    def expression(self, tree, read='x[%d]'):
+        "Returns the python expression of a tree over the words of the node values"
+        text, const = compiler.vector_expr( tree, self.layout.index, read=read )
+        if const:
+            return eval( text ) and '_ONES' or '_ZERO'
+        return text
+
+    def compile(self, name, lines):
+        self.namespace.update( _ONES=numpy.uint64( 2**64-1 ), _ZERO=numpy.uint64( 0 ) )
+        return SyncEngine.compile( self, name, lines )
+
+    def pack(self, values):
+        "Packs an array of shape (replicates, nodes) into words of shape (nodes, words)"
+        values = self.rows( values )
+        count  = len(values)
+        if count % 64:
+            padding = numpy.zeros( ( 64 - count % 64, values.shape[1] ), dtype=bool )
+            values  = numpy.concatenate( ( values, padding ) )
+
+        # byte k of a node holds the replicates 8*k to 8*k+7
+        bits = values.view( numpy.uint8 ).reshape( len(values) // 8, 8, values.shape[1] )
+        data = bits[:, 0, :].copy()
+        for shift in range(1, 8):
+            data |= bits[:, shift, :] << shift
+        return numpy.ascontiguousarray( data.T ).view( '<u8' ).astype( numpy.uint64 )
+
+    def unpack(self, words, count):
+        "Unpacks the words into an array of shape (replicates, nodes)"
+        data = numpy.ascontiguousarray( words, dtype='<u8' ).view( numpy.uint8 )
+        bits = numpy.unpackbits( data, axis=1, bitorder='little' )[:, :count]
+        return bits.astype( bool ).T
+
+    def words(self, values, steps):
+        """
+        Generates the packed words of shape (nodes, words) for each step,
+        starting with the initial values. The arrays are reused by the engine.
+        """
+        x   = self.pack( values )
+        out = numpy.empty_like( x )
+        size = x.shape[1]
+
+        self.times = [ 0 ]
+        schedule = self.schedule()
+        yield x
+        for step in range(steps):
+            numpy.copyto( out, x )
+            for rank in next( schedule ):
+                self.funcs[rank]( x, out, size )
+            x, out = out, x
+            yield x
+
+    def stream(self, values, steps):
+        count = len( self.rows( values ) )
+        for x in self.words( values, steps ):
+            yield self.unpack( x, count )
+
+    def run(self, values, steps):
+        "Runs the simulation, returns the last values as an array of shape (replicates, nodes)"
+        count = len( self.rows( values ) )
+        for x in self.words( values, steps ):
+            pass
+        return self.unpack( x, count )
+
+    def averages(self, values, steps):
+        count = len( self.rows( values ) )
+        # only the bits of the replicates are counted in the last word
+        last  = numpy.uint64( 2 ** ( count - 64 * ( (count - 1) // 64 ) ) - 1 )
+        total = numpy.empty( (steps+1, self.layout.size) )
+        for step, x in enumerate( self.words( values, steps ) ):
+            ones = bit_count( x[:, :-1] ).sum( axis=1 ) + bit_count( x[:, -1] & last )
+            total[step] = ones / count
+        return dict( (node, total[:, index]) for index, node in enumerate(self.nodes) )
+
+def bit_count( words ):
+    "Counts the bits that are set in each word"
+    if hasattr( numpy, 'bitwise_count' ):
+        return numpy.bitwise_count( words ).astype( numpy.int64 )
+    data = numpy.ascontiguousarray( words, dtype='<u8' ).view( numpy.uint8 ).reshape( words.shape + (8,) )
+    return numpy.unpackbits( data, axis=-1 ).sum( axis=-1, dtype=numpy.int64 )
+
+class AsyncEngine( Engine ):
+    """
+    Vectorized engine for the asynchronous and ranked modes
+
+    Every replicate applies the rules of a rank one at a time, in its 
+    own random order, and each rule sees the values set by the rules 
+    before it. The orders are drawn as a matrix that has a random 
+    permutation of the rules for each replicate.
+
+    >>> from boolean2 import boolmodel
+    >>> model = boolmodel.BoolModel( mode='async', text='A = B = C = False\\n A* = True\\n B* = A\\n C* = B' )
+    >>> engine = AsyncEngine( model, seed=1 )
+    >>> avgs = engine.averages( engine.initial_values( 1000 ), steps=3 )
+    >>> avgs['A'].tolist()
+    [0.0, 1.0, 1.0, 1.0]
+    >>> [ float( round(x, 1) ) for x in avgs['C'] ]
+    [0.0, 0.2, 0.7, 1.0]
+    """
+    def __init__(self, model, seed=None, tables=False):
+        Engine.__init__( self, model=model, seed=seed, tables=tables )
+
+        mode = model.parser.mode
+        if mode not in ( ruleparser.ASYNC, ruleparser.RANK ):
+            util.error( 'the asynchronous engine does not support the %s mode' % mode )
+
+        # a list of (row, function) pairs for each rank
+        index = self.layout.index
+        self.rules = {}
+        for rank in model.ranks:
+            lines = model.update_lines[rank]
+            rules = self.rules[rank] = []
+            for node, tree in compiler.parse_lines( lines ):
+                name = '_rule%d_%d' % (rank, len(rules))
+                text = self.expression( tree, read='x[%d, cols]' )
+                source = 'def %s(x, cols, size):\n    return %s' % (name, text)
+                exec( compile( source, '<%s>' % name, 'exec' ), self.namespace )
+                rules.append( ( index[node], self.namespace[name] ) )
+
+    def orders(self, count, size):
+        """
+        Returns an array of shape (count, size), column j contains
+        a random permutation of the rule indices for replicate j
+        """
+        # small integers allow for radix sorting when grouping
+        dtype = count < 2**15 and numpy.int16 or numpy.int64
+        base  = numpy.tile( numpy.arange( count, dtype=dtype ), (size, 1) )
+        return self.rng.permuted( base, axis=1 ).T
+
+    def apply(self, x, rules, orders):
+        """
+        Applies the rules in the given orders, the rule at position 
+        i for replicate j is orders[i, j]
+        """
+        count, size = orders.shape
+
+        # replicates grouped by the rule at each position
+        groups = numpy.argsort( orders, axis=1, kind='stable' )
+        keys   = orders + numpy.arange( count, dtype=numpy.int64 )[:, None] * count
+        ends   = numpy.bincount( keys.ravel(), minlength=count*count ).reshape( count, count ).cumsum( axis=1 )
+        for pos in range(count):
+            start = 0
+            for rule, end in enumerate( ends[pos] ):
+                if end > start:
+                    cols = groups[pos, start:end]
+                    row, func = rules[rule]
+                    x[row, cols] = func( x, cols, end - start )
+                start = end
+
+    def stream(self, values, steps):
+        x = self.check( values )
+        size = x.shape[1]
+        yield x.T
+        for step in range(steps):
+            for rank in self.model.ranks:
+                rules = self.rules[rank]
+                self.apply( x, rules, self.orders( len(rules), size ) )
+            yield x.T
+
+def test():
+    """
+    Main testrunnner
+    """
+    import doctest
+    doctest.testmod()
+
+if __name__ == '__main__':
+    test()
@@ -1,4 +1,6 @@
-from boolean2 import util, tokenizer, state
+import copy
+from collections import deque
+from boolean2 import util, tokenizer, state, compiler, ruleparser
 from boolean2.ruleparser import Parser
 
 class BoolModel(Parser):
@@ -6,23 +8,87 @@ class BoolModel(Parser):
     Maintains the functionality for all models
     """
 
+    # execute the updating rules as compiled python functions,
+    # set it to False to parse the rules on every step instead
+    COMPILE = True
+
+    # evaluate the compiled rules with few inputs by truth table lookups
+    TABLES = False
+
+    # in the synchronous mode execute only the rules whose inputs 
+    # changed in the previous step, see update_changed
+    INCREMENTAL = False
+
+    # the maximal number of states that get user friendly labels
+    LABEL_LIMIT = 100000
+
+    def __init__(self, mode, text ):
+        Parser.__init__( self, mode=mode, text=text )
+
+        # compiled rules keyed by the RULE_* functions they were compiled with
+        self.compiled = {}
+
+        # the rule dependencies of the incremental updates and the
+        # nodes changed by the last step, None when all rules need to run
+        self.depends = {}
+        self.changed = None
+
+        # boolean states are stored as vectors indexed by the layout,
+        # the plde mode keeps value triplets in attribute based states
+        if self.parser.mode == ruleparser.PLDE:
+            self.layout = None
+        else:
+            self.layout = state.Layout( self.nodes )
+
+        self.labels = state.Labels( limit=self.LABEL_LIMIT )
+
+    def clone(self):
+        """
+        Returns an independent copy of the model that reuses the tokens and 
+        rules of this model. The copy needs to be initialized.
+        """
+        other = copy.copy( self )
+
+        # a new parser with the same settings
+        other.parser = ruleparser.new_parser()
+        for attr in ruleparser.SETTINGS:
+            setattr( other.parser, attr, getattr( self.parser, attr ) )
+
+        other.nodes = copy.copy( self.nodes )
+        other.update_lines = dict( (rank, list(lines)) for rank, lines in list(self.update_lines.items()) )
+        other.states, other.lazy_data = [], {}
+        other.labels = state.Labels( limit=self.LABEL_LIMIT )
+
+        # only the rules compiled with the default RULE_* functions 
+        # are independent of the parser and may be shared
+        other.compiled, other.depends, other.changed = {}, {}, None
+        if compiler.uses_defaults( other.parser ):
+            other.compiled = dict( self.compiled )
+        return other
+
+    def new_state(self):
+        "Returns a new empty state"
+        if self.layout is None:
+            return state.State()
+        return self.layout.state()
+
     def initialize(self, missing=None, defaults={} ):
         """
         Initializes the model, needs to be called to reset the simulation 
         """
 
-        # create a new lexer                
-        self.lexer = tokenizer.Lexer().lexer
+        # the lexer used by the parser
+        self.lexer = tokenizer.get_lexer().lexer
         
-        self.parser.old = state.State()
-        self.parser.new = state.State()
+        self.parser.old = self.new_state()
+        self.parser.new = self.new_state()
        
         # references must be attached to the parser class 
         # to be visible during parsing
         self.states = self.parser.states = [ self.parser.old ]
 
-        # parser the initial data
-        list(map( self.local_parse, self.init_lines ))
+        # parse the initial data
+        self.execute( self.init_lines )
 
         # deal with uninitialized nodes
         if self.uninit_nodes:
@@ -44,6 +110,48 @@ class BoolModel(Parser):
         # will be populated upon the first call
         self.lazy_data = {}
 
+        # the starting point for the resets
+        self.initial = self.parser.old.copy()
+        self.changed = None
+
+    def reset(self, values=None):
+        """
+        Resets the model to the initial state created by the last call to 
+        initialize, without executing the initializers again. 
+        
+        The values overwrite the initial state, they may be a dictionary 
+        keyed by nodes or a vector with a value for each node in sorted order.
+        """
+        first = self.initial.copy()
+        if values is not None:
+            if hasattr( values, 'items' ):
+                for node, value in list(values.items()):
+                    first[node] = value
+            elif self.layout is None:
+                util.error( 'the values need to be a dictionary in the %s mode' % self.parser.mode )
+            else:
+                if isinstance( values, state.IndexedState ):
+                    values = values.data
+                data = bytearray( map( bool, values ) )
+                if len(data) != self.layout.size:
+                    util.error( 'the vector needs %d values, one for each node' % self.layout.size )
+                first.data[:] = data
+
+        self.parser.old = first
+        self.parser.new = first.copy()
+        self.states = self.parser.states = [ first ]
+        self.lazy_data = {}
+        self.changed = None
+
+    def resets(self, values):
+        """
+        Generates the model reset to each of the initial values in turn.
+        Iterate the model before moving to the next initial value.
+        """
+        for value in values:
+            self.reset( value )
+            yield self
+
     @property
     def first(self):
         "Returns the first state"
@@ -68,38 +176,233 @@ class BoolModel(Parser):
                     self.lazy_data.setdefault( node, []).append( state[node] )
         return self.lazy_data
 
-    def state_update(self):       
-        """Internal update function"""
-        p = self.parser       
-        p.old = p.new
-        p.new = p.new.copy()                     
-        p.states.append( p.new )
-
     def local_parse( self, line ):
         "Used like such only to keep track of the last parsed line"
         global LAST_LINE
         LAST_LINE = line
-        return self.parser.parse( line )
+        return self.parser.parse( line, lexer=self.lexer )
+
+    def rule_key( self ):
+        "The settings that the compiled rules depend on"
+        p = self.parser
+        return ( p.mode, self.TABLES, p.RULE_AND, p.RULE_OR, p.RULE_NOT, p.RULE_GETVALUE, p.RULE_SETVALUE )
+
+    def compile_rules( self ):
+        """
+        Returns the updating rules compiled into functions keyed by the lines.
+        The rules are compiled again when the RULE_* functions of the parser change.
+        """
+        p = self.parser
+        key = self.rule_key()
+        if key not in self.compiled:
+            lines = [ line for rank in self.ranks for line in self.update_lines[rank] ]
+            rules = compiler.compile_rules( p, lines, layout=self.layout, init_lines=self.init_lines, tables=self.TABLES )
+
+            # lines that could not be compiled will be parsed
+            for line, func in list(rules.items()):
+                if func is None:
+                    rules[line] = lambda old, new, line=line: self.local_parse( line )
+            self.compiled = { key: rules }
+
+        return self.compiled[key]
+
+    def execute( self, lines ):
+        "Executes the updating rules in the order they are listed"
+        if self.COMPILE:
+            rules = self.compile_rules()
+            old, new = self.parser.old, self.parser.new
+            for line in lines:
+                rules[line]( old, new )
+        else:
+            list(map( self.local_parse, lines ))
+
+    def dependencies( self ):
+        """
+        Returns the data of the incremental updates: the compiled rules, 
+        the index of the node that each rule sets, the positions of the 
+        rules that read each node and the positions of the rules with 
+        Random values. Returns None when a node has more than one rule,
+        in that case the order of the rules matters.
+        """
+        key = self.rule_key()
+        if key not in self.depends:
+            rules = self.compile_rules()
+            index = self.layout.index
+            lines = [ line for rank in self.ranks for line in self.update_lines[rank] ]
+            funcs, targets, always = [], [], []
+            readers = [ [] for node in self.layout.nodes ]
+            for pos, ( node, tree ) in enumerate( compiler.parse_lines( lines ) ):
+                funcs.append( rules[ lines[pos] ] )
+                targets.append( index[node] )
+                if compiler.has_random( tree ):
+                    always.append( pos )
+                for other in compiler.get_inputs( tree ):
+                    readers[ index[other] ].append( pos )
+
+            result = None
+            if len( set(targets) ) == len( targets ):
+                result = ( funcs, targets, readers, always )
+            self.depends = { key: result }
+
+        return self.depends[key]
+
+    def incremental( self ):
+        "Returns True when the next step may be an incremental update"
+        p = self.parser
+        return ( self.INCREMENTAL and self.COMPILE and p.mode == ruleparser.SYNC 
+            and compiler.uses_defaults( p ) and p.RULE_START_ITERATION is util.default_start_iteration 
+            and self.dependencies() is not None )
+
+    def update_changed( self ):
+        """
+        Executes the rules of one synchronous step that read a node that
+        changed in the previous step, the rules with Random values are 
+        executed in every step. The other nodes keep their values, 
+        as the new state starts as a copy of the old state.
+        """
+        funcs, targets, readers, always = self.dependencies()
+        p = self.parser
+        old, new = p.old, p.new
+
+        if self.changed is None:
+            dirty = range( len(funcs) )
+        else:
+            dirty = set( always )
+            for node in self.changed:
+                dirty.update( readers[node] )
+
+        od, nd = old.data, new.data
+        changed = []
+        for pos in dirty:
+            funcs[pos]( old, new )
+            node = targets[pos]
+            if nd[node] != od[node]:
+                changed.append( node )
+        self.changed = changed
+
+    def update( self, shuffler ):
+        """
+        Executes the updating rules of one step. The incremental 
+        updates do not use the shuffler, the order of the rules
+        does not matter in the synchronous mode.
+        """
+        if self.incremental():
+            return self.update_changed()
+
+        self.changed = None
+        for rank in self.ranks:
+            lines = self.update_lines[rank]
+            lines = shuffler( lines )
+            self.execute( lines )
+
+    def iterate_stream( self, steps, shuffler=util.default_shuffler ):
+        """
+        Generates the new state after each step without storing the states.
+        The generated states are not modified by the later steps.
+        """
+        # the state may have been edited since the last step
+        self.changed = None
+        p = self.parser
+        for index in range(steps):
+            p.RULE_START_ITERATION( index, self )
+            p.old = p.new
+            p.new = p.new.copy()
+            self.update( shuffler )
+            yield p.new
+
+    def recorder( self, every=1, last=None, nodes=None ):
+        """
+        Returns the function that stores the states during iteration.
+
+        Keeps only every n-th state when every is larger than 1, 
+        only the last few states in a ring buffer when last is set, 
+        and only the values of the listed nodes when nodes are set.
+        Setting last=1 keeps only the current state.
+        """
+        states, project = self.states, None
+
+        if nodes is not None:
+            if self.layout is None:
+                util.error( 'selecting nodes is not supported in the %s mode' % self.parser.mode )
+            sub   = state.Layout( nodes )
+            index = [ self.layout.index[node] for node in sub.nodes ]
+            def project( current ):
+                if current.layout == sub:
+                    return current
+                data = current.data
+                return sub.state( bytearray( [ data[i] for i in index ] ) )
+            states = list(map( project, states ))
+
+        if last is not None:
+            states = deque( states, maxlen=last )
+        elif isinstance( states, deque ):
+            states = list( states )
+        self.states = self.parser.states = states
 
-    def iterate( self, steps, shuffler=util.default_shuffler, **kwds ):
+        append = states.append
+        def record( index, current ):
+            if index % every == 0:
+                append( project and project(current) or current )
+        return record
+
+    def iterate( self, steps, shuffler=util.default_shuffler, every=1, last=None, nodes=None, until=None, **kwds ):
         """
-        Iterates over the lines 'steps' times. Allows other parameters for compatibility with the plde mode
+        Iterates over the lines 'steps' times. Allows other parameters for compatibility with the plde mode.
+
+        The every, last and nodes parameters select the states that are stored, see the recorder method.
+
+        When until='attractor' the iteration stops as soon as a steady state or a cycle 
+        is reached and returns a tuple with the number of steps before the attractor, 
+        the length of the cycle (1 for steady states, 0 if no attractor was found 
+        within the steps) and the list of states in the cycle. It requires a 
+        deterministic mode, where the next state depends only on the current one.
         """
         
         # needs to be reset in case the data changes
         self.lazy_data = {}
 
-        for index in range(steps):
-            self.parser.RULE_START_ITERATION( index, self )
-            self.state_update()
-            for rank in self.ranks:
-                lines = self.update_lines[rank]
-                lines = shuffler( lines )
-                list(map( self.local_parse, lines )) 
+        record = self.recorder( every=every, last=last, nodes=nodes )
+        stream = self.iterate_stream( steps, shuffler=shuffler )
+
+        if until is None:
+            for index, current in enumerate( stream ):
+                record( index+1, current )
+            return
+        
+        if until != 'attractor':
+            util.error( "the until parameter must be 'attractor'" )
+        if self.parser.mode not in ( ruleparser.SYNC, ruleparser.TIME ) or self.layout is None:
+            util.error( 'attractors can only be detected in the synchronous and time modes' )
+        if not compiler.uses_defaults( self.parser ):
+            util.error( 'attractors cannot be detected when the RULE_* functions are overridden' )
+        for rank in self.ranks:
+            for node, tree in compiler.parse_lines( self.update_lines[rank] ):
+                if compiler.has_random( tree ):
+                    util.error( 'the rule of node %s has a Random value, attractors cannot be detected' % node )
+
+        # compact state encodings with the step where they were first seen
+        keys = [ self.state_key( self.parser.new ) ]
+        seen = { keys[0]: 0 }
+        for index, current in enumerate( stream ):
+            record( index+1, current )
+            key = self.state_key( current )
+            if key in seen:
+                start = seen[key]
+                cycle = [ self.layout.state( bytearray(data) ) for data, phase in keys[start:] ]
+                return start, len(cycle), cycle
+            seen[key] = index + 1
+            keys.append( key )
+
+        return 0, 0, []
+
+    def state_key( self, current ):
+        "Compact encoding of everything that determines the next state"
+        return bytes( current.data ), 0
 
     def save_states(self, fname):
         """
-        Saves the states into a file
+        Saves the states into a file, the fingerprints identify the states.
+        The shorter labels of the states are available from the labels attribute.
         """
         if self.states:
             fp = open(fname, 'wt')
@@ -132,7 +435,7 @@ class BoolModel(Parser):
             print("Cycle of length %s starting at index %s" % (size, index))
     
     def fp(self):
-        "The models current fingerprint"
+        "The fingerprints of the current states of the model"
         return [ s.fp() for s in self.states ]
 
                  
@@ -0,0 +1,491 @@
+"""
+Compiles the rules into python functions
+
+The grammar in ruleparser.py re-parses the text of a rule every time
+the rule is executed. The functions in this module build an expression
+tree from the tokens of each rule once, then generate python code
+from the tree that can be executed many times.
+
+The expression trees are nested tuples with the token type first:
+
+    ('ID', name), ('STATE', value), ('TUPLE', conc, decay, threshold),
+    ('NOT', expr), ('AND', left, right), ('OR', left, right)
+"""
+import random
+from boolean2 import util, tokenizer
+
+# the mode that keeps the value triplets
+PLDE = 'plde'
+
+# rules with at most this many inputs may be turned into truth tables
+MAX_INPUTS = 8
+
+def uses_defaults( parser ):
+    "Returns True when the RULE_* functions of the parser have their default values"
+    return ( parser.RULE_AND is util.default_and and parser.RULE_OR is util.default_or
+        and parser.RULE_NOT is util.default_not and parser.RULE_GETVALUE is util.default_get_value
+        and parser.RULE_SETVALUE is util.default_set_value )
+
+class Context(object):
+    """
+    Stands in for the parser production that the RULE_* functions
+    receive as their last parameter
+    """
+    def __init__(self, parser, line):
+        self.parser = parser
+        self.line   = line
+
+def _type( tokens, pos ):
+    "Returns the type of the token at a position or None past the end"
+    if pos < len(tokens):
+        return tokens[pos].type
+    return None
+
+def _expect( tokens, pos, ttype ):
+    "Checks the type of the token at a position"
+    if _type(tokens, pos) != ttype:
+        util.error( "expected %s at position %s in '%s'" % (ttype, pos, tokenizer.tok2line(tokens)) )
+    return tokens[pos].value
+
+def _parse_or( tokens, pos ):
+    left, pos = _parse_and( tokens, pos )
+    while _type( tokens, pos ) == 'OR':
+        right, pos = _parse_and( tokens, pos+1 )
+        left = ( 'OR', left, right )
+    return left, pos
+
+def _parse_and( tokens, pos ):
+    left, pos = _parse_not( tokens, pos )
+    while _type( tokens, pos ) == 'AND':
+        right, pos = _parse_not( tokens, pos+1 )
+        left = ( 'AND', left, right )
+    return left, pos
+
+def _parse_not( tokens, pos ):
+    if _type( tokens, pos ) == 'NOT':
+        expr, pos = _parse_not( tokens, pos+1 )
+        return ( 'NOT', expr ), pos
+    return _parse_atom( tokens, pos )
+
+def _parse_atom( tokens, pos ):
+    ttype = _type( tokens, pos )
+    if ttype == 'ID':
+        return ( 'ID', tokens[pos].value ), pos+1
+    if ttype == 'STATE':
+        return ( 'STATE', tokens[pos].value ), pos+1
+    if ttype == 'LPAREN':
+        # value triplets look like (conc, decay, threshold)
+        if _type( tokens, pos+1 ) == 'NUMBER':
+            conc  = _expect( tokens, pos+1, 'NUMBER' )
+            _expect( tokens, pos+2, 'COMMA' )
+            decay = _expect( tokens, pos+3, 'NUMBER' )
+            _expect( tokens, pos+4, 'COMMA' )
+            tresh = _expect( tokens, pos+5, 'NUMBER' )
+            _expect( tokens, pos+6, 'RPAREN' )
+            return ( 'TUPLE', conc, decay, tresh ), pos+7
+        expr, pos = _parse_or( tokens, pos+1 )
+        _expect( tokens, pos, 'RPAREN' )
+        return expr, pos+1
+    util.error( "unexpected token at position %s in '%s'" % (pos, tokenizer.tok2line(tokens)) )
+
+def parse_expression( tokens ):
+    """
+    Builds an expression tree from a list of tokens.
+    Uses the same precedence as the grammar: or < and < not
+
+    >>> parse_expression( tokenizer.tokenize('A or not B and C')[0] )
+    ('OR', ('ID', 'A'), ('AND', ('NOT', ('ID', 'B')), ('ID', 'C')))
+    """
+    tree, pos = _parse_or( tokens, 0 )
+    if pos != len(tokens):
+        util.error( "unexpected token at position %s in '%s'" % (pos, tokenizer.tok2line(tokens)) )
+    return tree
+
+def parse_update( tokens ):
+    """
+    Parses an updating rule, returns the updated node and the expression tree.
+    The rank label, if present, is skipped.
+
+    >>> parse_update( tokenizer.tokenize('1: A* = not B')[0] )
+    ('A', ('NOT', ('ID', 'B')))
+    """
+    if _type( tokens, 0 ) == 'LABEL':
+        tokens = tokens[1:]
+    node = _expect( tokens, 0, 'ID' )
+    _expect( tokens, 1, 'ASSIGN' )
+    _expect( tokens, 2, 'EQUAL' )
+    return node, parse_expression( tokens[3:] )
+
+def parse_init( tokens ):
+    """
+    Parses an initializer, returns the initialized nodes
+    (in the order of assignment) and the expression tree.
+
+    >>> parse_init( tokenizer.tokenize('A = B = True')[0] )
+    (['B', 'A'], ('STATE', 'True'))
+    """
+    nodes = []
+    while _type( tokens, 0 ) == 'ID' and _type( tokens, 1 ) == 'EQUAL':
+        nodes.append( tokens[0].value )
+        tokens = tokens[2:]
+    if not nodes:
+        util.error( "not an initializer '%s'" % tokenizer.tok2line(tokens) )
+
+    # the grammar assigns the rightmost node first
+    nodes.reverse()
+    return nodes, parse_expression( tokens )
+
+def parse_lines( lines ):
+    """
+    Parses a list of updating rules, returns a list of (node, tree) pairs
+    """
+    lexer = tokenizer.get_lexer()
+    return [ parse_update( lexer.tokenize_line( line ) ) for line in lines ]
+
+def get_inputs( tree ):
+    """
+    Returns the set of nodes that an expression tree depends on
+
+    >>> sorted( get_inputs( parse_expression( tokenizer.tokenize('A and (B or not A)')[0] ) ) )
+    ['A', 'B']
+    """
+    if tree[0] == 'ID':
+        return set( [ tree[1] ] )
+    if tree[0] in ( 'AND', 'OR', 'NOT' ):
+        nodes = set()
+        for child in tree[1:]:
+            nodes |= get_inputs( child )
+        return nodes
+    return set()
+
+def _input_mask( size, position ):
+    """
+    Returns an integer with the bits of the truth table rows in which 
+    the input at a position is true, the first input is the highest bit
+    of the row number
+    """
+    block = 2 ** ( size - 1 - position )
+    mask, width = ( ( 1 << block ) - 1 ) << block, 2 * block
+    while width < 2 ** size:
+        mask |= mask << width
+        width *= 2
+    return mask
+
+def _table_bits( tree, masks, full ):
+    "Evaluates a tree over all rows of the truth table at once, one row per bit"
+    kind = tree[0]
+    if kind == 'ID':
+        return masks[ tree[1] ]
+    if kind == 'STATE':
+        return tree[1] == 'True' and full or 0
+    if kind == 'TUPLE':
+        conc, decay, tresh = tree[1:]
+        return conc > tresh / decay and full or 0
+    if kind == 'NOT':
+        return full & ~_table_bits( tree[1], masks, full )
+    left  = _table_bits( tree[1], masks, full )
+    right = _table_bits( tree[2], masks, full )
+    if kind == 'AND':
+        return left & right
+    return left | right
+
+def truth_table( tree, limit=MAX_INPUTS ):
+    """
+    Turns an expression tree into a truth table. Returns the sorted
+    inputs and a tuple with the value of the expression for each row.
+    The row number packs the values of the inputs as bits, the first
+    input being the highest bit. Returns None for expressions with
+    Random values or with more than limit inputs.
+
+    >>> truth_table( parse_expression( tokenizer.tokenize('B and not A')[0] ) )
+    (['A', 'B'], (False, True, False, False))
+    """
+    if has_random( tree ):
+        return None
+    inputs = sorted( get_inputs( tree ) )
+    size = len(inputs)
+    if size > limit:
+        return None
+
+    full  = ( 1 << 2 ** size ) - 1
+    masks = dict( ( node, _input_mask( size, pos ) ) for pos, node in enumerate(inputs) )
+    bits  = _table_bits( tree, masks, full )
+    return inputs, tuple( bool( (bits >> row) & 1 ) for row in range( 2 ** size ) )
+
+def has_random( tree ):
+    "Returns true if an expression tree contains a Random value"
+    if tree[0] == 'STATE':
+        return tree[1] == 'Random'
+    if tree[0] in ( 'AND', 'OR', 'NOT' ):
+        return any( has_random( child ) for child in tree[1:] )
+    return False
+
+def table_index( inputs, read ):
+    """
+    Returns the python expression of the truth table row from the
+    node values, the nodes are read with the read pattern.
+
+    >>> table_index( [ 'A', 'B', 'C' ], read='od[%s]' )
+    '(od[A] << 2 | od[B] << 1 | od[C])'
+    """
+    size  = len(inputs)
+    parts = [ read % node for node in inputs ]
+    parts = [ '%s << %d' % (part, size-1-pos) for pos, part in enumerate( parts[:-1] ) ] + parts[-1:]
+    return '(%s)' % ' | '.join( parts )
+
+class Emitter(object):
+    """
+    Generates python source code from the expression trees.
+
+    Operations that are left at their default values in the parser
+    are inlined, the overridden ones are called with the same
+    parameters that the grammar uses. Inlined operations only short
+    circuit when the skipped operands have no side effects, so the
+    RULE_* functions get called in the same order as in the grammar.
+
+    When a layout is given the inlined operations access the 
+    vectors of the states by index, otherwise they access
+    the attributes of the states by name.
+
+    With tables set, the rules that have at most MAX_INPUTS inputs
+    are evaluated by looking up their truth tables when all 
+    operations are inlined.
+    """
+    def __init__(self, parser, layout=None, tables=False ):
+        self.parser = parser
+        self.layout = layout
+        self.tables = tables
+        self.sync   = parser.sync
+        self.plde   = parser.mode == PLDE
+        self.inline = dict(
+            AND = parser.RULE_AND is util.default_and,
+            OR  = parser.RULE_OR  is util.default_or,
+            NOT = parser.RULE_NOT is util.default_not,
+            GET = parser.RULE_GETVALUE is util.default_get_value,
+            SET = parser.RULE_SETVALUE is util.default_set_value,
+        )
+        self.namespace = dict(
+            _AND = parser.RULE_AND, _OR = parser.RULE_OR, _NOT = parser.RULE_NOT,
+            _GET = parser.RULE_GETVALUE, _SET = parser.RULE_SETVALUE,
+            _choice = random.choice, _tuple = util.bool_to_tuple, _BOOLS = (True, False),
+        )
+        self.count = 0
+        self.lexer = tokenizer.get_lexer()
+
+    def context( self, line ):
+        "Adds a new production stand-in to the namespace, returns its name"
+        name = '_p%d' % self.count
+        self.count += 1
+        self.namespace[name] = Context( parser=self.parser, line=line )
+        return name
+
+    def key( self, node ):
+        "The key of a node in the state storage"
+        if self.layout is None:
+            return repr( node )
+        return str( self.layout.index[node] )
+
+    def get_value( self, state, node, ctx ):
+        "Reads the value of a node"
+        if self.inline['GET']:
+            return '%sd[%s]' % (state[0], self.key(node))
+        return '_GET(%s, %r, %s)' % (state, node, ctx)
+
+    def set_value( self, state, node, value, ctx ):
+        "Writes the value of a node"
+        if self.inline['SET']:
+            return '%sd[%s] = %s' % (state[0], self.key(node), value)
+        return '_SET(%s, %r, %s, %s)' % (state, node, value, ctx)
+
+    def storage( self ):
+        "Source line that binds the storage of the states"
+        if self.layout is None:
+            return '    od, nd = old.__dict__, new.__dict__'
+        return '    od, nd = old.data, new.data'
+
+    def expr( self, tree, ctx, source ):
+        """
+        Returns the python expression for a tree and
+        a flag that is true if evaluating it has no side effects.
+        The source is the name of the state the nodes are read from.
+        """
+        kind = tree[0]
+        if kind == 'ID':
+            return self.get_value( source, tree[1], ctx ), self.inline['GET']
+
+        if kind == 'STATE':
+            if tree[1] == 'Random':
+                text = '_choice(_BOOLS)'
+                if self.plde:
+                    text = '_tuple(%s)' % text
+                return text, False
+            value = ( tree[1] == 'True' )
+            if self.plde:
+                return repr( util.bool_to_tuple( value ) ), True
+            return repr( value ), True
+
+        if kind == 'TUPLE':
+            conc, decay, tresh = tree[1:]
+            if self.plde:
+                return '(%r, %r, %r)' % (conc, decay, tresh), True
+            return '(%r > %r / %r)' % (conc, tresh, decay), True
+
+        if kind == 'NOT':
+            text, pure = self.expr( tree[1], ctx, source )
+            if self.inline['NOT']:
+                return '(not %s)' % text, pure
+            return '_NOT(%s, %s)' % (text, ctx), False
+
+        # binary operators
+        left,  lpure = self.expr( tree[1], ctx, source )
+        right, rpure = self.expr( tree[2], ctx, source )
+        if self.inline[kind] and lpure and rpure:
+            return '(%s %s %s)' % (left, kind.lower(), right), True
+        return '_%s(%s, %s, %s)' % (kind, left, right, ctx), False
+
+    def lookup( self, tree, source ):
+        """
+        Returns the python expression that looks up the value of 
+        a tree in its truth table or None if there is no table
+        """
+        if not self.tables or self.plde or not all( self.inline.values() ):
+            return None
+        result = truth_table( tree )
+        if result is None or not result[0]:
+            return None
+        inputs, table = result
+        name = '_table%d' % self.count
+        self.count += 1
+        self.namespace[name] = table
+        index = table_index( [ self.key(node) for node in inputs ], read='%sd[%%s]' % source[0] )
+        return '%s[%s]' % (name, index)
+
+    def update( self, name, line ):
+        """
+        Returns the source of a function that executes an updating rule
+        """
+        node, tree = parse_update( self.lexer.tokenize_line( line ) )
+        ctx = self.context( line )
+
+        # this is the only distinction between synchronous and asynchronous updating
+        source = self.sync and 'old' or 'new'
+        value = self.lookup( tree, source )
+        if value is None:
+            value, pure = self.expr( tree, ctx, source )
+
+        body = [
+            'def %s(old, new):' % name,
+            self.storage(),
+            '    ' + self.set_value( 'new', node, value, ctx ),
+        ]
+        return '\n'.join( body )
+
+    def init( self, name, line ):
+        """
+        Returns the source of a function that executes an initializer,
+        it sets the values in both the old and new states
+        """
+        nodes, tree = parse_init( self.lexer.tokenize_line( line ) )
+        ctx = self.context( line )
+
+        source = self.sync and 'old' or 'new'
+        value, pure = self.expr( tree, ctx, source )
+
+        body = [
+            'def %s(old, new):' % name,
+            self.storage(),
+            '    value = %s' % value,
+        ]
+        for node in nodes:
+            body.append( '    ' + self.set_value( 'old', node, 'value', ctx ) )
+            body.append( '    ' + self.set_value( 'new', node, 'value', ctx ) )
+        return '\n'.join( body )
+
+def vector_expr( tree, index, read='x[%d]' ):
+    """
+    Returns a python expression that evaluates a tree over arrays 
+    of node values with the bitwise operators and a flag that is
+    true when the expression is a constant. The nodes are read with
+    the read pattern filled in with the index of the node. Random 
+    values are produced by calling _random(size).
+
+    >>> vector_expr( ('AND', ('ID', 'A'), ('NOT', ('ID', 'B'))), dict(A=0, B=1) )
+    ('(x[0] & ~x[1])', False)
+    >>> vector_expr( ('OR', ('ID', 'A'), ('STATE', 'False')), dict(A=0) )
+    ('x[0]', False)
+    """
+    kind = tree[0]
+    if kind == 'ID':
+        return read % index[tree[1]], False
+
+    if kind == 'STATE':
+        if tree[1] == 'Random':
+            return '_random(size)', False
+        return repr( tree[1] == 'True' ), True
+
+    if kind == 'TUPLE':
+        conc, decay, tresh = tree[1:]
+        return repr( conc > tresh / decay ), True
+
+    if kind == 'NOT':
+        text, const = vector_expr( tree[1], index, read )
+        if const:
+            return '(not %s)' % text, True
+        return '~%s' % text, False
+
+    left,  lconst = vector_expr( tree[1], index, read )
+    right, rconst = vector_expr( tree[2], index, read )
+    if lconst and rconst:
+        return '(%s %s %s)' % (left, kind.lower(), right), True
+
+    # a constant operand either decides the result or drops out
+    if lconst or rconst:
+        value, other = lconst and ( eval(left), right ) or ( eval(right), left )
+        if value != ( kind == 'AND' ):
+            return repr( value ), True
+        return other, False
+
+    oper = kind == 'AND' and '&' or '|'
+    return '(%s %s %s)' % (left, oper, right), False
+
+def compile_rules( parser, lines, layout=None, init_lines=[], tables=False ):
+    """
+    Compiles the updating rules and the initializers into functions that 
+    take the old and new states as parameters. Returns a dictionary keyed 
+    by the lines. The layout must be given when the states are indexed states.
+    With tables set the rules with few inputs look up their truth tables.
+
+    Lines that cannot be compiled are mapped to None,
+    these need to be executed by the parser.
+    """
+    emitter = Emitter( parser, layout=layout, tables=tables )
+    sources, names = [], {}
+    jobs = [ (line, emitter.update) for line in lines ] + [ (line, emitter.init) for line in init_lines ]
+    for line, func in jobs:
+        if line in names:
+            continue
+        name = '_rule%d' % len(names)
+        try:
+            sources.append( func( name, line ) )
+            names[line] = name
+        except util.BooleanError:
+            names[line] = None
+
+    namespace = emitter.namespace
+    code = compile( '\n\n'.join(sources), '<rules>', 'exec' )
+    exec( code, namespace )
+
+    rules = {}
+    for line, name in list(names.items()):
+        rules[line] = name and namespace[name]
+    return rules
+
+def test():
+    """
+    Main testrunnner
+    """
+    import doctest
+    doctest.testmod()
+
+if __name__ == '__main__':
+    test()
@@ -1,67 +1,171 @@
-from boolean2 import util
-import random
-from itertools import count
+from boolean2 import util, state, statespace
+import random, colorsys
+from array import array
+from itertools import count, islice
+from xml.sax.saxutils import quoteattr
 
 try:
     import networkx
-    from networkx import components as component
 except ImportError as exc:
     util.error( f"networkx import error : {exc}. Install newest version from https://networkx.lanl.gov/")
 
+try:
+    import numpy
+except ImportError as exc:
+    util.error( f"numpy import error : {exc}. Install it from https://numpy.org/" )
+
 # color constants
 BLUE, RED, GREEN = "#0000DD", "#DD0000", "#00DD00"
 WHITE, PURPLE, ORANGE = "#FFFFFF", "#990066", "#FF3300"
 TEAL, CRIMSON, GOLD, NAVY, SIENNA = "#009999", "#DC143C",  "#FFD700", "#000080", "#A0522D"
 LIGHT_GREEN, SPRING_GREEN, YELLOW_GREEN = "#33FF00", "#00FF7F", "#9ACD32"
 
+# the first colors of the palette in hexadecimal Red/Green/Blue notation
+COLORS = [ ORANGE, SPRING_GREEN, GOLD, TEAL, PURPLE, NAVY, SIENNA, CRIMSON, BLUE, ]
+
+def palette( count ):
+    """
+    Returns a list of count colors. The first ones are the COLORS, 
+    the others are spread around the color wheel by the golden ratio.
+
+    >>> palette( 11 )[-3:]
+    ['#0000DD', '#77B4D9', '#E6F261']
+    """
+    colors = COLORS[:count]
+    for index in range( len(colors), count ):
+        hue = ( index * 0.618033988749895 ) % 1
+        sat = 0.45 + 0.15 * ( index % 3 )
+        val = 0.95 - 0.1 * ( index % 2 )
+        rgb = colorsys.hsv_to_rgb( hue, sat, val )
+        colors.append( '#%02X%02X%02X' % tuple( int( round( x * 255 ) ) for x in rgb ) )
+    return colors
+
+def csr_graph( edges, size ):
+    """
+    Converts an array of node number pairs into compressed sparse rows,
+    returns the indptr and indices arrays
+
+    >>> indptr, indices = csr_graph( numpy.array( [ [2, 0], [0, 1], [2, 1] ] ), 3 )
+    >>> indptr.tolist(), indices.tolist()
+    ([0, 1, 1, 3], [1, 0, 1])
+    """
+    edges = numpy.asarray( edges, dtype=numpy.int64 ).reshape( -1, 2 )
+    order = numpy.argsort( edges[:, 0], kind='stable' )
+    indptr = numpy.zeros( size+1, dtype=numpy.int64 )
+    numpy.cumsum( numpy.bincount( edges[:, 0], minlength=size ), out=indptr[1:] )
+    return indptr, edges[order, 1]
+
+def strong_components( edges, size ):
+    """
+    Finds the strongly connected components of a graph with size 
+    nodes numbered from zero, the edges are node number pairs.
+    Returns the number of components and an array with the 
+    component of each node.
+    """
+    return statespace.strong_components( *csr_graph( edges, size ) )
+
+def component_sizes( labels ):
+    """
+    Summarizes the component sizes, returns a list of (size, components) 
+    pairs with the number of components that have each size
+
+    >>> component_sizes( numpy.array( [0, 1, 0, 2, 3, 3] ) )
+    [(1, 2), (2, 2)]
+    """
+    sizes, counts = numpy.unique( numpy.bincount( labels ), return_counts=True )
+    return list( zip( sizes.tolist(), counts.tolist() ) )
+
 def component_colormap(graph):
     """
-    Colormap by strong compoments
+    Colormap by strong components, each component gets its own color
     """
-    # automatically color by components
+    nodes = list( graph.nodes() )
+    index = dict( (node, number) for number, node in enumerate(nodes) )
+    edges = [ ( index[source], index[target] ) for source, target in graph.edges() ]
+    count, labels = strong_components( edges, len(nodes) )
+    colors = palette( count )
+    return dict( ( node, colors[label] ) for node, label in zip( nodes, labels.tolist() ) )
 
-    # a list of colors in hexadecimal Red/Gree/Blue notation
-    colors = [ ORANGE, SPRING_GREEN, GOLD, TEAL, PURPLE, NAVY, SIENNA, CRIMSON, BLUE, ]
-    
-    # find the strongly connected components
-    components = list(component.strongly_connected_components( graph ))
-    
-    # make sure we have as many colors as components
-    if len(colors) < len(components):
-        util.warn( 'there are more components than colors!' )
+# the number of lines formatted before each write
+BLOCK = 10000
 
-    # create the colormap
-    colormap = {}
-    for color, comp in  zip(colors, components):
-        for node in comp:
-            colormap[node] = color
-    return colormap
+def write_lines( fname, lines ):
+    "Writes the lines to a file in blocks"
+    fp = open( fname, 'wt' )
+    for block in iter( lambda: list( islice( lines, BLOCK ) ), [] ):
+        fp.writelines( block )
+    fp.close()
 
-def write_gml( graph, fname, colormap={} ):
+def positions( layout, seed ):
+    "Generates random node coordinates, or None values without a layout"
+    rng = random.Random( seed )
+    while 1:
+        if layout:
+            yield rng.randint( 50, 200 ), rng.randint( 50, 200 )
+        else:
+            yield None
 
+def gml_lines( nodes, edges, colormap={}, layout=True, seed=None ):
+    "Generates the lines of a gml file"
+    yield 'graph [\ndirected 1\n'
+
+    nodepatt = 'node [ id %(node)s label "%(node)s" graphics [ fill	"%(color)s" w 40 h 30%(coords)s type "ellipse" ]]\n'
+    for node, pos in zip( nodes, positions( layout, seed ) ):
+        coords = pos and ' x %s y %s' % pos or ''
+        color  = colormap.get(node, '#CCCCFF')
+        yield nodepatt % dict( node=node, coords=coords, color=color )
+
+    edgepatt = 'edge [ source %(source)s target %(target)s  graphics [ fill	"%(color)s" targetArrow "delta" ]]\n'
+    for source, target in edges:
+        color = colormap.get( (source, target), '#000000' )
+        yield edgepatt % dict( source=source, target=target, color=color )
     
-    "Custom gml exporter"
-    fp = open(fname, 'wt')
-    text = [ 'graph [', 'directed 1' ]
-
-    nodepatt = 'node [ id %(node)s label "%(node)s" graphics [ fill	"%(color)s" w 40 h 30 x %(x)s y %(y)s type "ellipse" ]]'
-    rnd = random.randint
-    for node in graph.nodes():
-        x, y = rnd(50,200), rnd(50, 200)
-        color = colormap.get(node, '#CCCCFF')
-        param = dict( node=node, x=x, y=y, color=color )
-        text.append(  nodepatt % param)
-    
-    edgepatt = 'edge [ source %(source)s target %(target)s  graphics [ fill	"%(color)s" targetArrow "delta" ]]'
-    for source, target in graph.edges():
-        pair  = (source, target)
-        color = colormap.get(pair, '#000000')
-        param = dict( source=source, target=target, color=color )
-        text.append( edgepatt % param)
-    
-    text.append( ']' )
-    fp.write( util.join( text, sep="\n" ) )
-    fp.close()
+    yield ']\n'
+
+def graphml_lines( nodes, edges, colormap={}, layout=True, seed=None ):
+    "Generates the lines of a graphml file"
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+    yield '<key id="color" for="all" attr.name="color" attr.type="string"/>\n'
+    if layout:
+        yield '<key id="x" for="node" attr.name="x" attr.type="int"/>\n'
+        yield '<key id="y" for="node" attr.name="y" attr.type="int"/>\n'
+    yield '<graph id="G" edgedefault="directed">\n'
+
+    for node, pos in zip( nodes, positions( layout, seed ) ):
+        color  = colormap.get(node, '#CCCCFF')
+        coords = pos and '<data key="x">%s</data><data key="y">%s</data>' % pos or ''
+        yield '<node id=%s><data key="color">%s</data>%s</node>\n' % ( quoteattr( str(node) ), color, coords )
+
+    for source, target in edges:
+        color = colormap.get( (source, target), '#000000' )
+        yield '<edge source=%s target=%s><data key="color">%s</data></edge>\n' % ( quoteattr( str(source) ), quoteattr( str(target) ), color )
+
+    yield '</graph>\n</graphml>\n'
+
+def edge_lines( edges, sep=',' ):
+    "Generates the lines of an edge list"
+    for source, target in edges:
+        yield '%s%s%s\n' % ( source, sep, target )
+
+def write_gml( graph, fname, colormap={}, layout=True, seed=None ):
+    """
+    Custom gml exporter, the file is written while it is generated.
+    The nodes are placed randomly when the layout is true, the seed 
+    makes the placement reproducible.
+    """
+    write_lines( fname, gml_lines( graph.nodes(), graph.edges(), colormap=colormap, layout=layout, seed=seed ) )
+
+def write_graphml( graph, fname, colormap={}, layout=True, seed=None ):
+    """
+    Graphml exporter, the colors and the positions are node and edge data.
+    The nodes are placed randomly when the layout is true, as with write_gml.
+    """
+    write_lines( fname, graphml_lines( graph.nodes(), graph.edges(), colormap=colormap, layout=layout, seed=seed ) )
+
+def write_edges( graph, fname, sep=',' ):
+    "Writes the edges as lines with the source and target separated by sep"
+    write_lines( fname, edge_lines( graph.edges(), sep=sep ) )
 
 class TransGraph(object):
     """
@@ -98,9 +202,15 @@ class TransGraph(object):
                 self.graph.add_edge(head, tail)
                 self.seen.add(pair)
         
-    def save(self, fname, colormap={}):
-        "Saves the graph as gml"
-        write_gml(graph=self.graph, fname=fname, colormap=colormap)
+    def export(self, fname, colormap={}, layout=True, seed=None):
+        "Writes the graph into a gml file"
+        write_gml( graph=self.graph, fname=fname, colormap=colormap, layout=layout, seed=seed )
+
+    def save(self, fname, colormap={}, layout=True, seed=None):
+        "Saves the graph as gml and the node values of the states into the log"
+        self.export( fname, colormap=colormap, layout=layout, seed=seed )
+        if not self.fp:
+            return
     
         self.fp.write( '*** node values ***\n' )
 
@@ -113,10 +223,138 @@ class TransGraph(object):
             line = [ fprint ]  + list(map(int, list(state.values()) ))
             self.fp.write( util.join(line) )
 
+class CompactTransGraph( TransGraph ):
+    """
+    Represents a transition graph that is built from many trajectories
+    of indexed states.
+
+    The states are numbered in the order they are first seen, the
+    transitions are collected as pairs of these numbers in growable 
+    arrays. They are packed into 64 bit integers and deduplicated by 
+    sorting when the arrays fill up or when the edges are needed. 
+    The log is written in blocks and is optional. The networkx graph 
+    is only created when the graph attribute is accessed.
+
+    >>> trans = CompactTransGraph( verbose=True )
+    >>> layout = state.Layout( [ 'A', 'B' ] )
+    >>> states = [ layout.state( bytearray(data) ) for data in ( [0, 0], [0, 1], [0, 0], [0, 1] ) ]
+    >>> trans.add( states )
+    >>> trans.edges().tolist()
+    [[0, 1], [1, 0]]
+    >>> sorted( trans.graph.edges() )
+    [('00', '01'), ('01', '00')]
+    """
+    def __init__(self, logfile=None, verbose=False, capacity=2**20):
+        self.fp = logfile and open( logfile, 'wt', buffering=2**16 )
+        self.verbose = verbose
+        self.capacity = capacity
+        self.store = dict()
+        self.colors = dict()
+        self.ids = dict()
+        self.keys = []
+        self.heads, self.tails = array( 'q' ), array( 'q' )
+        self.packed = numpy.empty( 0, dtype=numpy.int64 )
+        self.cache = None
+
+    def number(self, state):
+        "Returns the number of a state, numbers the new states"
+        data = bytes( state.data )
+        try:
+            return self.ids[data]
+        except KeyError:
+            key = self.verbose and state.bin() or state.fp()
+            self.store[key] = state
+            self.keys.append( key )
+            value = self.ids[data] = len(self.ids)
+            return value
+
+    def add(self, states, times=None):
+        "Adds states to the transition"
+        numbers = list(map( self.number, states ))
+        self.heads.extend( numbers[:-1] )
+        self.tails.extend( numbers[1:] )
+        self.cache = None
+
+        if self.fp:
+            keys  = self.keys
+            names = [ keys[number] for number in numbers ]
+            times = times or list(range(len(states)))
+            lines = [ '*** transitions from %s ***\n' % names[0] ]
+            lines.extend( 'T=%s: %s->%s\n' % triple for triple in zip( times, names, names[1:] ) )
+            self.fp.writelines( lines )
+
+        if len(self.heads) >= self.capacity:
+            self.compact()
+
+    def compact(self):
+        "Merges the collected transitions into the sorted distinct transitions"
+        if self.heads:
+            heads = numpy.frombuffer( self.heads, dtype=numpy.int64 )
+            tails = numpy.frombuffer( self.tails, dtype=numpy.int64 )
+            packed = numpy.concatenate( ( self.packed, ( heads << 32 ) | tails ) )
+            self.packed = numpy.unique( packed )
+            self.heads, self.tails = array( 'q' ), array( 'q' )
+        return self.packed
+
+    def edges(self):
+        "Returns the distinct transitions as an array of state number pairs"
+        packed = self.compact()
+        return numpy.column_stack( ( packed >> 32, packed & 0xFFFFFFFF ) )
+
+    @property
+    def graph(self):
+        "The transition graph as a networkx graph"
+        if self.cache is None:
+            self.cache = networkx.MultiDiGraph()
+            keys = self.keys
+            self.cache.add_edges_from( ( keys[head], keys[tail] ) for head, tail in self.edges().tolist() )
+        return self.cache
+
+    def components(self):
+        "Returns the number of strong components and the component of each state number"
+        return strong_components( self.edges(), len(self.keys) )
+
+    def colormap(self):
+        "Colormap of the state names by strong components"
+        count, labels = self.components()
+        colors = palette( count )
+        return dict( ( key, colors[label] ) for key, label in zip( self.keys, labels.tolist() ) )
+
+    def named_edges(self):
+        "Generates the distinct transitions as pairs of state names"
+        keys  = self.keys
+        edges = self.edges()
+        for start in range(0, len(edges), BLOCK):
+            for head, tail in edges[start:start+BLOCK].tolist():
+                yield keys[head], keys[tail]
+
+    def export(self, fname, colormap={}, layout=True, seed=None):
+        "Writes the graph into a gml file without creating the networkx graph"
+        write_lines( fname, gml_lines( self.keys, self.named_edges(), colormap=colormap, layout=layout, seed=seed ) )
+
+    def save(self, fname, colormap={}, layout=True, seed=None):
+        TransGraph.save( self, fname=fname, colormap=colormap, layout=layout, seed=seed )
+        if self.fp:
+            self.fp.flush()
+
+    def save_edges(self, fname, binary=False, sep=','):
+        """
+        Writes the transitions into an edge list. The binary file
+        contains pairs of 64 bit state numbers, the numbers are the 
+        indices of the state names in the keys attribute
+        """
+        if binary:
+            self.edges().astype( '<i8' ).tofile( fname )
+        else:
+            write_lines( fname, edge_lines( self.named_edges(), sep=sep ) )
+
 def test():
     """
     Main testrunnner
     """
+    import doctest
+    doctest.testmod()
+
     from boolean2 import boolmodel
     
     text = """
@@ -5,7 +5,7 @@
 #
 # http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/496761
 #
-from collections import MutableMapping as DictMixin
+from collections.abc import MutableMapping as DictMixin
 
 class odict(DictMixin):
     """
@@ -13,22 +13,22 @@ class odict(DictMixin):
     >>> o[2]=20 ; o[1]=10
     >>> o.keys()
     [2, 1]
-    >>> o.values()
+    >>> list( o.values() )
     [20, 10]
-    >>> o.items()
+    >>> list( o.items() )
     [(2, 20), (1, 10)]
     >>> [ x for x in o ]
     [2, 1]
     >>>
     >>> d = dict()
     >>> d[2]=20 ; d[1]=10
-    >>> d.keys()
+    >>> sorted( d.keys() )
     [1, 2]
-    >>> d.values()
+    >>> sorted( d.values() )
     [10, 20]
-    >>> d.items()
+    >>> sorted( d.items() )
     [(1, 10), (2, 20)]
-    >>> [ x for x in d ]
+    >>> sorted( x for x in d )
     [1, 2]
 
     """
@@ -50,6 +50,12 @@ class odict(DictMixin):
         del self._data[key]
         self._keys.remove(key)
         
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
     def keys(self):
         return list(self._keys)
     
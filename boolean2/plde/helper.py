@@ -14,7 +14,7 @@ except:
     pass
 """
 
-from .defs import *
+from boolean2.plde.defs import *
 
 def change(node, indexer):
     "Returns the change for a node"
@@ -51,6 +51,60 @@ def default( node, indexer, tokens):
     piece  = piecewise( tokens, indexer )
     return '%s = %s' % ( newval, piece )
 
+class Symbols(object):
+    """
+    Stands in for the parameters when generating code. The generated code 
+    looks up the parameters by name instead of containing their values,
+    so the same code serves every parameter set.
+
+    >>> par = Symbols( 'par' )
+    >>> str( par['MPI'].h )
+    "par['MPI']['h']"
+    >>> 'hill( c0, h=%s )' % par['MPI'].h
+    "hill( c0, h=par['MPI']['h'] )"
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __getitem__(self, key):
+        return Symbols( '%s[%r]' % ( self.name, key ) )
+
+    def __getattr__(self, attr):
+        if attr.startswith( '__' ):
+            raise AttributeError( attr )
+        return self[attr]
+
+    def __str__(self):
+        return self.name
+
+class Stacked(object):
+    """
+    Stacks the parameters of many rows, the numerical values 
+    are returned as arrays with one element for each row
+
+    >>> rows = [ dict( MPI=dict( h=1, n=2 ) ), dict( MPI=dict( h=3, n=4 ) ) ]
+    >>> Stacked( rows )['MPI']['h'].tolist()
+    [1.0, 3.0]
+    """
+    def __init__(self, rows):
+        self.rows  = rows
+        self.cache = {}
+
+    def __getitem__(self, key):
+        import numpy
+        if key not in self.cache:
+            values = [ row[key] for row in self.rows ]
+            try:
+                self.cache[key] = numpy.array( values, dtype=float )
+            except (TypeError, ValueError):
+                self.cache[key] = Stacked( values )
+        return self.cache[key]
+
+    def __getattr__(self, attr):
+        if attr.startswith( '__' ):
+            raise AttributeError( attr )
+        return self[attr]
+
 def hill_func( node, indexer, par):
     """
     Generates a hill function call based on the parameters 
@@ -100,6 +154,33 @@ def piecewise( tokens, indexer ):
     
     return ' '.join( line )
 
+# the operators of the vector equations work on boolean arrays
+VECTOR_OPERATORS = { 'and':'&', 'or':'|', 'not':'~', 'True':'numpy.True_', 'False':'numpy.False_' }
+
+def vector_piecewise( tokens, indexer ):
+    """
+    Generates a piecewise equation from the tokens that works on 
+    arrays of concentrations, the comparisons are combined as masks
+    """
+    base_node  = tokens[1].value
+    base_index = indexer[base_node]
+    line = []
+    line.append ( '(' )
+    nodes = [ t.value for t in tokens[4:] ]
+    for node in nodes:
+        if node in indexer:
+            index = indexer[node]
+            value = " ( c%d > t%d ) " % ( index, index )
+        else:
+            value = VECTOR_OPERATORS.get( node, node )
+        line.append ( value )
+    line.append ( ')' )
+
+    # add decay term
+    line.append ( "- d%d * c%d" % ( base_index, base_index ) )
+
+    return ' '.join( line )
+
 def init_line( store ):
     """
     Store is an incoming dictionary prefilled with parameters
@@ -150,10 +231,12 @@ class Parameter(object):
     """
     Allows attribute access to the parameters (Bunch)
     """
-    def __init___(self, **kwds):
+    def __init__(self, **kwds):
         self.__dict__.update( kwds )
     
     def __getattr__(self, attr):
+        if attr.startswith( '__' ):
+            raise AttributeError( attr )
         return self[attr]
 
     def __getitem__(self, key):
@@ -189,7 +272,7 @@ def read_parameters( fname ):
     
     def something( row ):
         # skips rows with empty elements
-        return [x for x in map(string.strip, row ) if x]
+        return [x for x in map(str.strip, row ) if x]
     
     # load the file, skipping commented or empty rows
     lines = list(filter( something, csv.reader( CommentedFile(fname)))) 
@@ -238,7 +321,7 @@ class CommentedFile:
     """
     def __init__(self, fp):
         if isinstance(fp, str):
-            fp = file(fp, 'rU')
+            fp = open(fp, newline='')
         self.fp = fp
 
     def __next__(self):
@@ -250,4 +333,12 @@ class CommentedFile:
     def __iter__(self):
         return self
 
+def test():
+    """
+    Main testrunnner
+    """
+    import doctest
+    doctest.testmod()
 
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,212 @@
+"""
+Numerical integrators for the piecewise linear differential equations
+
+The integrators take a derivative function derivs(x, t) and return the
+values at each of the requested times in an array with the times in the
+first axis. The states may be arrays of any shape, a (batch, nodes) state
+integrates many systems at once.
+
+The rk4 integrator takes fixed steps between the requested times, the
+rk45 integrator is the adaptive Dormand-Prince method that picks the steps
+from an error estimate and interpolates the values at the requested times.
+"""
+from boolean2 import util
+
+try:
+    import numpy
+except ImportError as exc:
+    util.error( f"numpy import error : {exc}. Install it from https://numpy.org/" )
+
+RK4, RK45 = 'rk4 rk45'.split()
+METHODS = [ RK4, RK45 ]
+
+# the Dormand-Prince tableau
+C = numpy.array( [ 0, 1/5, 3/10, 4/5, 8/9, 1 ] )
+A = [
+    [],
+    [ 1/5 ],
+    [ 3/40, 9/40 ],
+    [ 44/45, -56/15, 32/9 ],
+    [ 19372/6561, -25360/2187, 64448/6561, -212/729 ],
+    [ 9017/3168, -355/33, 46732/5247, 49/176, -5103/18656 ],
+]
+B = numpy.array( [ 35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0 ] )
+
+# the difference of the fifth and fourth order solutions
+E = numpy.array( [ -71/57600, 0, 71/16695, -71/1920, 17253/339200, -22/525, 1/40 ] )
+
+# the coefficients of the fourth order dense output
+P = numpy.array( [
+    [ 1, -8048581381/2820520608, 8663915743/2820520608, -12715105075/11282082432 ],
+    [ 0, 0, 0, 0 ],
+    [ 0, 131558114200/32700410799, -68118460800/10900136933, 87487479700/32700410799 ],
+    [ 0, -1754552775/470086768, 14199869525/1410260304, -10690763975/1880347072 ],
+    [ 0, 127303824393/49829197408, -318862633887/49829197408, 701980252875/199316789632 ],
+    [ 0, -282668133/205662961, 2019193451/616988883, -1453857185/822651844 ],
+    [ 0, 40617522/29380423, -110615467/29380423, 69997945/29380423 ],
+] )
+
+class Counter(object):
+    """
+    Wraps a derivative function to return arrays and to count the calls
+
+    >>> func = Counter( lambda x, t: ( x[1], -x[0] ) )
+    >>> func( numpy.array( [ 1.0, 2.0 ] ), 0 ).tolist()
+    [2.0, -1.0]
+    >>> func.calls
+    1
+    """
+    def __init__(self, derivs):
+        self.derivs = derivs
+        self.calls = 0
+
+    def __call__(self, x, t):
+        self.calls += 1
+        return numpy.asarray( self.derivs( x, t ), dtype=float )
+
+def times( t ):
+    "Returns the times as an array, checks that they increase"
+    t = numpy.asarray( t, dtype=float )
+    if t.ndim != 1 or len(t) == 0:
+        util.error( 'the times must be a nonempty list' )
+    if numpy.any( numpy.diff( t ) <= 0 ):
+        util.error( 'the times must be increasing' )
+    return t
+
+def rk4( derivs, x0, t ):
+    """
+    Integrates with the fixed step fourth order Runge-Kutta method,
+    one step between each of the consecutive times
+
+    >>> t = numpy.linspace( 0, 1, 11 )
+    >>> values = rk4( lambda x, t: -x, [ 1.0, 2.0 ], t )
+    >>> values.shape
+    (11, 2)
+    >>> numpy.allclose( values[-1], numpy.exp( -1 ) * numpy.array( [ 1, 2 ] ) )
+    True
+    """
+    t = times( t )
+    x = numpy.array( x0, dtype=float )
+    out = numpy.empty( ( len(t), ) + x.shape )
+    out[0] = x
+    for i in range( len(t) - 1 ):
+        t0, h = t[i], t[i+1] - t[i]
+        k1 = numpy.asarray( derivs( x, t0 ), dtype=float )
+        k2 = numpy.asarray( derivs( x + h/2 * k1, t0 + h/2 ), dtype=float )
+        k3 = numpy.asarray( derivs( x + h/2 * k2, t0 + h/2 ), dtype=float )
+        k4 = numpy.asarray( derivs( x + h * k3, t0 + h ), dtype=float )
+        x = x + h/6 * ( k1 + 2*k2 + 2*k3 + k4 )
+        out[i+1] = x
+    return out
+
+def norm( x ):
+    "Root mean square norm"
+    return numpy.sqrt( numpy.mean( numpy.square( x ) ) )
+
+def first_step( func, x, t0, f0, span, rtol, atol ):
+    "Estimates the size of the first step from the scale of the derivatives"
+    scale = atol + rtol * numpy.abs( x )
+    d0, d1 = norm( x / scale ), norm( f0 / scale )
+    h0 = 1e-6 if d0 < 1e-5 or d1 < 1e-5 else 0.01 * d0 / d1
+    h0 = min( h0, span )
+
+    # the change of the derivatives over an explicit euler step
+    f1 = func( x + h0 * f0, t0 + h0 )
+    d2 = norm( ( f1 - f0 ) / scale ) / h0
+    if max( d1, d2 ) <= 1e-15:
+        h1 = max( 1e-6, h0 * 1e-3 )
+    else:
+        h1 = ( 0.01 / max( d1, d2 ) ) ** ( 1/5 )
+    return min( 100 * h0, h1, span )
+
+def rk45( derivs, x0, t, rtol=1e-6, atol=1e-9, hmin=0.0, max_steps=10**6 ):
+    """
+    Integrates with the adaptive Dormand-Prince method, the values at the
+    requested times are interpolated from the steps with the dense output.
+
+    The piecewise equations switch when a node crosses its threshold, a node
+    that drives itself below the threshold may switch back and forth at a
+    fixed value. The steps of at most hmin are accepted regardless of the error
+    so that the integration crosses these points instead of shrinking the steps.
+
+    >>> t = numpy.linspace( 0, 10, 101 )
+    >>> func = Counter( lambda x, t: -x )
+    >>> values = rk45( func, [ 1.0, 2.0 ], t )
+    >>> numpy.allclose( values, numpy.exp( -t )[:, None] * [ 1, 2 ], atol=1e-6 )
+    True
+    >>> func.calls < 4 * len(t)
+    True
+    """
+    t = times( t )
+    func = derivs if isinstance( derivs, Counter ) else Counter( derivs )
+    x = numpy.array( x0, dtype=float )
+    out = numpy.empty( ( len(t), ) + x.shape )
+    out[0] = x
+
+    t0, end = t[0], t[-1]
+    if len(t) == 1:
+        return out
+
+    f0 = func( x, t0 )
+    h = first_step( func, x, t0, f0, end - t0, rtol, atol )
+    k = numpy.empty( ( 7, ) + x.shape )
+    pos, steps = 1, 0
+    while pos < len(t):
+        steps += 1
+        if steps > max_steps:
+            util.error( 'the integration did not finish in %d steps at time %s' % ( max_steps, t0 ) )
+        last = h >= end - t0
+        h = min( h, end - t0 )
+        if h <= 1e-12 * max( 1.0, abs( t0 ) ):
+            util.error( 'the integration step became too small at time %s' % t0 )
+
+        # the stages of the step, the last one is the derivative at the new point
+        k[0] = f0
+        for s in range( 1, 6 ):
+            dx = sum( a * k[j] for j, a in enumerate( A[s] ) )
+            k[s] = func( x + h * dx, t0 + C[s] * h )
+        x1 = x + h * numpy.tensordot( B[:6], k[:6], axes=1 )
+        k[6] = func( x1, t0 + h )
+
+        scale = atol + rtol * numpy.maximum( numpy.abs( x ), numpy.abs( x1 ) )
+        error = norm( h * numpy.tensordot( E, k, axes=1 ) / scale )
+        if error > 1 and h > hmin:
+            h = max( hmin, h * max( 0.2, 0.9 * error ** ( -1/5 ) ) )
+            continue
+
+        # interpolates the requested times within the step
+        t1 = end if last else t0 + h
+        stop = pos
+        while stop < len(t) and t[stop] <= t1:
+            stop += 1
+        if stop > pos:
+            theta = ( t[pos:stop] - t0 ) / h
+            powers = numpy.cumprod( numpy.repeat( theta[:, None], 4, axis=1 ), axis=1 )
+            coeffs = numpy.tensordot( powers, P.T, axes=1 )
+            out[pos:stop] = x + h * numpy.tensordot( coeffs, k, axes=1 )
+            pos = stop
+            if t[stop-1] == t1:
+                out[stop-1] = x1
+
+        t0, x, f0 = t1, x1, k[6].copy()
+        h = max( hmin, h * ( min( 10.0, 0.9 * error ** ( -1/5 ) ) if error > 0 else 10.0 ) )
+
+    return out
+
+def integrate( derivs, x0, t, method=RK4, **kwds ):
+    "Integrates with the selected method"
+    if method == RK4:
+        return rk4( derivs, x0, t, **kwds )
+    if method == RK45:
+        return rk45( derivs, x0, t, **kwds )
+    util.error( 'integration method must be one of %s' % METHODS )
+
+def test():
+    """
+    Main testrunnner
+    """
+    import doctest
+    doctest.testmod()
+
+if __name__ == '__main__':
+    test()
@@ -1,17 +1,28 @@
 
-import sys, os
+import sys, os, hashlib
 from itertools import *
 
 from boolean2.boolmodel import BoolModel
 from boolean2 import util, odict, tokenizer
-from . import helper
-import imp
+from . import helper, integrate
 
 try:
-    import pylab
-    from pylab import arange, rk4
-except ImportError:
-    util.error( "matplotlib is missing, install it from: http://matplotlib.sourceforge.net/")
+    import numpy
+except ImportError as exc:
+    util.error( f"numpy import error : {exc}. Install it from https://numpy.org/" )
+
+# the compiled generated code keyed by the hash of the source
+CODE_CACHE = {}
+CODE_LIMIT = 256
+
+def compile_code( text ):
+    "Compiles the generated code, the same source is compiled only once"
+    key = hashlib.sha1( text.encode() ).hexdigest()
+    if key not in CODE_CACHE:
+        if len(CODE_CACHE) >= CODE_LIMIT:
+            del CODE_CACHE[ next( iter( CODE_CACHE ) ) ]
+        CODE_CACHE[key] = compile( text, '<plde-%s>' % key[:8], 'exec' )
+    return CODE_CACHE[key]
 
 def default_override( node, indexer, tokens ):
     """
@@ -30,6 +41,15 @@ def default_equation( tokens, indexer ):
     text = helper.change(node, indexer) + ' = ' + helper.piecewise(tokens, indexer)
     return text
 
+def default_vector_equation( tokens, indexer ):
+    """
+    Default equation generator of the vector code, the 
+    concentrations are arrays with the replicates
+    """
+    node = tokens[1].value
+    text = helper.change(node, indexer) + ' = ' + helper.vector_piecewise(tokens, indexer)
+    return text
+
 def boolmapper (value):
     if type(value) == tuple:
         return value
@@ -52,6 +72,7 @@ class PldeModel( BoolModel ):
         self.INIT_LINE  = helper.init_line
         self.OVERRIDE   = default_override
         self.DEFAULT_EQUATION = default_equation
+        self.VECTOR_EQUATION = default_vector_equation
         self.EXTRA_INIT = ''
 
         # setting up this engine
@@ -102,12 +123,12 @@ class PldeModel( BoolModel ):
             init.append( line )
         
         if localdefs:
-            init.extend( [ '# custom imports', 'import %s' % localdefs, 'reload(%s)' % localdefs, 'from %s import *' % localdefs ]   )
+            init.extend( [ '# custom imports', 'import importlib', 'import %s' % localdefs, 'importlib.reload(%s)' % localdefs, 'from %s import *' % localdefs ]   )
 
         init_text = '\n'.join( init )
         return init_text
     
-    def create_equation( self, tokens ):
+    def create_equation( self, tokens, vector=False ):
         """
         Creates a python equation from a list of tokens.
         """
@@ -116,7 +137,9 @@ class PldeModel( BoolModel ):
         lines = [ '', original ]
         
         line  = self.OVERRIDE(node, indexer=self.indexer, tokens=tokens)
-        if line is None:
+        if line is None and vector:
+            line = self.VECTOR_EQUATION( tokens=tokens, indexer=self.indexer )
+        elif line is None:
             line = self.DEFAULT_EQUATION( tokens=tokens, indexer=self.indexer )
         
         if isinstance(line, str):
@@ -140,7 +163,6 @@ class PldeModel( BoolModel ):
         zeros   = ', '.join( zeros )
 
         body = []
-        body.append( 'x0 = %s' % assign )
         body.append( 'def derivs( x, t):' )
          
         body.append( '    %s = x' % assign )
@@ -155,51 +177,175 @@ class PldeModel( BoolModel ):
         
         return text
 
-    def iterate( self, fullt, steps, autogen_fname=None, localdefs=None, autogen='autogen'  ):
+    def generate_vector_function(self ):
         """
-        Iterates over the system of equations 
+        Generates the function that integrates arrays of states with
+        the nodes in the last axis. The concentrations are unpacked into 
+        arrays, the equations combine them with array operations so the 
+        overrides must also work on arrays.
         """
-        if autogen_fname is not None:
-            autogen = autogen_fname
-            del autogen_fname
-            util.warn("parameter 'autogen_fname' is deprecated. Use 'autogen' instead." )
-        
-        # setting up the timesteps
-        dt = fullt/float(steps)
-        self.t  = [ dt * i for i in range(steps) ]
+        sep = ' ' * 4
 
-        # generates the initializator and adds the timestep
-        self.init_text  = self.generate_init( localdefs=localdefs )
-        self.init_text += '\ndt = %s' % dt
+        indices = [ x[0] for x in list(self.mapper.values()) ]
+        names   = lambda patt: ', '.join( [ patt % i for i in indices ] ) + ','
 
-        #print init_text
-        
-        # generates the derivatives
-        self.func_text = self.generate_function()
-        #print func_text
-       
-        self.dynamic_code = self.init_text + '\n' + self.func_text             
-        
-        try:
+        body = []
+        body.append( 'def derivs( x, t):' )
+        body.append( '    %s = numpy.moveaxis( x, -1, 0 )' % names( 'c%d' ) )
+        body.append( '    %s = %s' % ( names( 'n%d' ), ', '.join( [ '0.0' for i in indices ] ) ) )
+        for tokens in self.update_tokens:
+            equation = self.create_equation( tokens, vector=True )
+            equation = [ sep + e for e in equation ]
+            body.append( '\n'.join( equation)  )
+        body.append( '' )
+        body.append( "    return numpy.stack( numpy.broadcast_arrays( %s ), axis=-1 ) " % names( 'n%d' ) )
+        text = '\n'.join( body )
+
+        return text
+
+    def generate_code( self, localdefs=None, vector=False ):
+        """
+        Generates the module with the build function that returns the derivatives
+        for the decays, thresholds, parameters and timestep. The values are 
+        not part of the code, the same compiled code serves every parameter set.
+        """
+        indices = [ x[0] for x in list(self.mapper.values()) ]
+        names   = lambda patt: ', '.join( [ patt % i for i in indices ] ) + ','
+        unpack  = vector and 'numpy.moveaxis( %s, -1, 0 )' or '%s'
+
+        init = [ ]
+        init.extend( self.EXTRA_INIT.splitlines() )
+        init.append( '# dynamically generated code' )
+        init.append( '# abbreviations: c=concentration, d=decay, t=threshold, n=newvalue' )
+        if localdefs:
+            init.extend( [ '# custom imports', 'import importlib', 'import %s' % localdefs, 'importlib.reload(%s)' % localdefs, 'from %s import *' % localdefs ]   )
+        init.append( 'import numpy' )
+        init.append( 'def build( _decay, _threshold, par=None, dt=None ):' )
+        init.append( '    %s = %s' % ( names( 'd%d' ), unpack % '_decay' ) )
+        init.append( '    %s = %s' % ( names( 't%d' ), unpack % '_threshold' ) )
+
+        func = vector and self.generate_vector_function() or self.generate_function()
+        body = [ '    ' + line for line in func.splitlines() ]
+        body.append( '    return derivs' )
+        return '\n'.join( init + body )
+
+    def values( self ):
+        """
+        Returns the concentrations, decays and thresholds of the nodes 
+        as arrays, a custom INIT_LINE is executed to find the values
+        """
+        if self.INIT_LINE is helper.init_line:
+            triplets = [ boolmapper( triplet ) for index, node, triplet in list(self.mapper.values()) ]
+        else:
+            namespace = {}
+            exec( self.generate_init( localdefs=None ), namespace )
+            triplets = [ [ namespace[ '%s%d' % (patt, index) ] for patt in 'cdt' ] for index, node, triplet in list(self.mapper.values()) ]
+        conc, decay, threshold = numpy.array( triplets, dtype=float ).reshape( -1, 3 ).T
+        return conc, decay, threshold
+
+    def load( self, code, autogen=None ):
+        """
+        Executes the generated code in a namespace of its own and returns the 
+        build function, the code is compiled once. When autogen is set the 
+        code is also written into the autogen.py file for debugging.
+        """
+        self.dynamic_code = code
+        if autogen:
             fp = open( '%s.py' % autogen, 'wt')
-            fp.write( '%s\n' % self.init_text )
-            fp.write( '%s\n' % self.func_text )
+            fp.write( '%s\n' % self.dynamic_code )
             fp.close()
-            autogen_mod = __import__( autogen )
-            try:
-                os.remove( '%s.pyc' % autogen )
-            except OSError:
-                pass # must be a read only filesystem
-            imp.reload( autogen_mod )
+
+        try:
+            self.namespace = dict( __name__=autogen or 'autogen' )
+            exec( compile_code( self.dynamic_code ), self.namespace )
         except Exception as exc:
             msg = "'%s' in:\n%s\n*** dynamic code error ***\n%s" % ( exc, self.dynamic_code, exc )
             util.error(msg)
 
-        # x0 has been auto generated in the initialization
-        self.alldata = rk4(autogen_mod.derivs, autogen_mod.x0, self.t) 
+        return self.namespace['build']
+
+    def timesteps( self, fullt, steps ):
+        "Sets up the timesteps, returns the length of the steps"
+        dt = fullt/float(steps)
+        self.t  = [ dt * i for i in range(steps) ]
+        return dt
+
+    def iterate( self, fullt, steps, autogen_fname=None, localdefs=None, autogen=None, method=integrate.RK4, vector=False, starts=None, par=None, **kwds ):
+        """
+        Iterates over the system of equations 
+
+        The generated code is compiled in memory and executed in a namespace 
+        of its own. When autogen is set the code is also written into the 
+        autogen.py file for debugging. The par parameter is passed to the 
+        generated code, see the sweep method.
+
+        The method selects the integrator, the rk4 method takes one fixed step
+        per timestep, the adaptive rk45 method takes the rtol and atol tolerances
+        as keyword arguments and reports the values at the same timesteps.
+
+        With vector set the derivatives are computed with array operations,
+        the starts may then list the initial concentrations of many replicates 
+        with the nodes in the last axis, all of them are integrated together. 
+        The data of each node then lists the values of the replicates at each timestep.
+        """
+        if autogen_fname is not None:
+            autogen = autogen_fname
+            del autogen_fname
+            util.warn("parameter 'autogen_fname' is deprecated. Use 'autogen' instead." )
         
+        dt = self.timesteps( fullt, steps )
+        if starts is not None:
+            vector = True
+
+        # generates and loads the derivatives
+        conc, decay, threshold = self.values()
+        build = self.load( self.generate_code( localdefs=localdefs, vector=vector ), autogen=autogen )
+        self.derivs = build( decay, threshold, par, dt )
+
+        derivs = integrate.Counter( self.derivs )
+        x0 = conc if starts is None else starts
+        self.alldata = integrate.integrate( derivs, x0, self.t, method=method, **kwds )
+        self.evaluations = derivs.calls
+
         for index, node in enumerate( self.nodes ):
-            self.lazy_data[node] = [ row[index] for row in self.alldata ]
+            self.lazy_data[node] = self.alldata[..., index].tolist()
+
+    def sweep( self, fullt, steps, rows, initializer=helper.initializer, localdefs=None, method=integrate.RK4, vector=False, **kwds ):
+        """
+        Integrates the model for each parameter row with the same compiled code
+
+        Each row initializes the model with initializer(row) as the missing values 
+        and is passed to the generated code as par. Overrides that build their 
+        equations with helper.Symbols('par') in place of the parameters look up 
+        the values of the row when the code runs. With vector set the rows 
+        are integrated together, then the par values are arrays over the rows.
+
+        Returns the values in an array of shape (rows, steps, nodes).
+        """
+        dt = self.timesteps( fullt, steps )
+        params = []
+        for row in rows:
+            self.initialize( missing=initializer( row ) )
+            params.append( self.values() )
+        conc, decay, threshold = [ numpy.array( values ) for values in zip( *params ) ]
+        code = self.generate_code( localdefs=localdefs, vector=vector )
+
+        if vector:
+            build = self.load( code )
+            derivs = integrate.Counter( build( decay, threshold, helper.Stacked( rows ), dt ) )
+            values = integrate.integrate( derivs, conc, self.t, method=method, **kwds )
+            self.evaluations = derivs.calls
+            return numpy.ascontiguousarray( values.transpose( 1, 0, 2 ) )
+
+        # the code is executed for each row to start from fresh local definitions
+        result = numpy.empty( ( len(rows), steps, len(self.nodes) ) )
+        self.evaluations = 0
+        for pos, row in enumerate( rows ):
+            build = self.load( code )
+            derivs = integrate.Counter( build( decay[pos], threshold[pos], row, dt ) )
+            result[pos] = integrate.integrate( derivs, conc[pos], self.t, method=method, **kwds )
+            self.evaluations += derivs.calls
+        return result
     
 if __name__ == '__main__':
     text = """
@@ -0,0 +1,154 @@
+"""
+Parameter scans of the PLDE models in a pool of processes
+
+A scan runs every combination of rule texts, parameter rows and starting
+states. The texts may be the wild type rules and the knockouts made with
+boolean2.modify_states. Each job seeds the random generators from its position
+so a scan gives the same results regardless of the number of processes.
+
+The workers write the trajectories into a results array stored in a .npy
+file that each of them maps into memory, the jobs are listed in an index
+table stored next to it. Both can be opened with the load function.
+"""
+import os, random
+from itertools import chain
+
+from boolean2 import util
+from boolean2.plde import helper
+
+try:
+    import numpy
+    from numpy.lib.format import open_memmap
+except ImportError as exc:
+    util.error( f"numpy import error : {exc}. Install it from https://numpy.org/" )
+
+# the fields of the index table
+INDEX_DTYPE = [ ('job', 'i8'), ('text', 'i8'), ('row', 'i8'), ('start', 'i8'), ('seed', 'i8'), ('evaluations', 'i8') ]
+
+def index_name( fname ):
+    "The name of the index file that belongs to a results file"
+    base, ext = os.path.splitext( fname )
+    return base + '-index.npz'
+
+def load( fname, mode='r' ):
+    """
+    Opens the results of a scan, returns the results mapped into memory
+    with shape (jobs, steps, nodes), the index table, the nodes and the
+    names of the texts
+    """
+    values = numpy.load( fname, mmap_mode=mode )
+    with numpy.load( index_name( fname ) ) as data:
+        index, nodes, names = data['index'], data['nodes'].tolist(), data['names'].tolist()
+    return values, index, nodes, names
+
+# the state of each worker process
+WORKER = {}
+
+def start_worker( scan, fname ):
+    "Sets up a worker process"
+    WORKER.clear()
+    WORKER.update( scan=scan, models={}, out=open_memmap( fname, mode='r+' ) )
+
+def run_worker( jobs ):
+    """
+    Runs a chunk of jobs in a worker process, returns a list of 
+    ( position, derivative calls ) pairs, one for each job
+    """
+    scan, out = WORKER['scan'], WORKER['out']
+    results = []
+    for job in jobs:
+        pos = int( job['job'] )
+        model = WORKER['models'].get( job['text'] )
+        if model is None:
+            model = WORKER['models'][ job['text'] ] = scan.model( job['text'] )
+        out[pos] = scan.run( model, job )
+        results.append( ( pos, model.evaluations ) )
+    out.flush()
+    return results
+
+class Scan(object):
+    """
+    Integrates the PLDE model for every combination of the rule texts,
+    parameter rows and starting states.
+
+    The texts are a list of rules or a dictionary keyed by their names.
+    Each parameter row initializes the nodes with initializer(row) as the
+    missing values and is passed to the generated code as par, see
+    PldeModel.sweep. The starts are dictionaries of node values that are
+    used as the defaults of the initialization. The setup function is called
+    with each new model, it should be defined at the module level so that
+    it can be sent to the worker processes. The remaining keyword arguments
+    are passed to PldeModel.iterate.
+    """
+    def __init__(self, texts, rows, fullt, steps, starts=[ {} ], initializer=helper.initializer, setup=None, seed=0, **kwds):
+        if isinstance( texts, dict ):
+            self.names, self.texts = list( texts.keys() ), list( texts.values() )
+        else:
+            self.names, self.texts = [ 'text%d' % pos for pos in range( len(texts) ) ], list( texts )
+        self.rows, self.starts = list( rows ), list( starts )
+        self.fullt, self.steps = fullt, steps
+        self.initializer, self.setup = initializer, setup
+        self.seed, self.kwds = seed, kwds
+
+        # the nodes must be the same for every text
+        self.nodes = None
+        for pos in range( len(self.texts) ):
+            nodes = sorted( self.model( pos ).nodes )
+            if self.nodes not in ( None, nodes ):
+                util.error( 'the texts of a scan must have the same nodes' )
+            self.nodes = nodes
+
+    def model(self, text):
+        "Returns the model of the text with the given position"
+        from boolean2.plde.model import PldeModel
+        model = PldeModel( text=self.texts[text] )
+        if self.setup:
+            self.setup( model )
+        return model
+
+    def jobs(self):
+        "Returns the index table that lists the jobs"
+        shape = ( len(self.texts), len(self.rows), len(self.starts) )
+        index = numpy.zeros( numpy.prod( shape ), dtype=INDEX_DTYPE )
+        index['job'] = numpy.arange( len(index) )
+        index['text'], index['row'], index['start'] = numpy.unravel_index( index['job'], shape )
+        index['seed'] = numpy.random.SeedSequence( self.seed ).generate_state( len(index), dtype=numpy.uint32 )
+        return index
+
+    def run(self, model, job):
+        "Runs a job on the model, returns the values with shape (steps, nodes)"
+        seed = int( job['seed'] )
+        random.seed( seed )
+        numpy.random.seed( seed )
+        row = self.rows[ job['row'] ]
+        model.initialize( missing=self.initializer( row ), defaults=self.starts[ job['start'] ] )
+        model.iterate( fullt=self.fullt, steps=self.steps, par=row, **self.kwds )
+        return model.alldata
+
+    def execute(self, fname, processes=None):
+        """
+        Runs the jobs in a pool of processes and writes the results into the file,
+        with one process the jobs run in this process. Returns the results mapped
+        into memory and the index table.
+        """
+        import multiprocessing
+
+        index = self.jobs()
+        out = open_memmap( fname, mode='w+', dtype=float, shape=( len(index), self.steps, len(self.nodes) ) )
+        del out
+
+        # the workers flush their writes once per chunk
+        size = max( 1, len(index) // ( 4 * ( processes or os.cpu_count() or 1 ) ) )
+        chunks = [ index[start:start+size] for start in range( 0, len(index), size ) ]
+        if processes == 1:
+            start_worker( self, fname )
+            results = list( map( run_worker, chunks ) )
+            WORKER.clear()
+        else:
+            with multiprocessing.Pool( processes, initializer=start_worker, initargs=( self, fname ) ) as pool:
+                results = pool.map( run_worker, chunks, chunksize=1 )
+
+        for pos, calls in chain.from_iterable( results ):
+            index['evaluations'][pos] = calls
+        numpy.savez( index_name( fname ), index=index, nodes=numpy.array( self.nodes ), names=numpy.array( self.names ) )
+        return numpy.load( fname, mmap_mode='r' ), index
@@ -0,0 +1,233 @@
+"""
+Network reduction by constant propagation
+
+Nodes that start with a fixed value and have no updating rules never
+change. Substituting their values into the other rules may turn further
+rules into constants, when such a constant matches the initial value of
+its node that node is frozen as well. The search starts from all nodes 
+with fixed initial values and drops the ones that may change, so groups
+of nodes that keep each other frozen are found as well. The frozen nodes 
+are removed and the remaining rules are simplified, the reduced model 
+produces the same trajectories for the remaining nodes.
+
+Knockouts and overexpression can be simulated by fixing nodes, this
+removes their rules the same way as tokenizer.modify_states does.
+"""
+from boolean2 import util, tokenizer, compiler, ruleparser
+
+def constant( tree ):
+    "Returns the value of a constant tree or None"
+    if tree[0] == 'STATE' and tree[1] != 'Random':
+        return tree[1] == 'True'
+    if tree[0] == 'TUPLE':
+        conc, decay, tresh = tree[1:]
+        return conc > tresh / decay
+    return None
+
+def as_tree( value ):
+    "The tree of a boolean value"
+    return ( 'STATE', repr( bool(value) ) )
+
+def simplify( tree, fixed ):
+    """
+    Substitutes the fixed values of the nodes into a tree and folds the constants.
+    Operands with Random values are kept so that the same random values are drawn.
+
+    >>> tree = compiler.parse_expression( tokenizer.tokenize( 'A and not B or C' )[0] )
+    >>> simplify( tree, dict( B=False ) )
+    ('OR', ('ID', 'A'), ('ID', 'C'))
+    >>> simplify( tree, dict( A=True, C=True ) )
+    ('STATE', 'True')
+    """
+    kind = tree[0]
+    if kind == 'ID':
+        if tree[1] in fixed:
+            return as_tree( fixed[ tree[1] ] )
+        return tree
+
+    if kind == 'NOT':
+        child = simplify( tree[1], fixed )
+        value = constant( child )
+        if value is not None:
+            return as_tree( not value )
+        return ( 'NOT', child )
+
+    if kind in ( 'AND', 'OR' ):
+        left  = simplify( tree[1], fixed )
+        right = simplify( tree[2], fixed )
+        for const, other in ( ( left, right ), ( right, left ) ):
+            value = constant( const )
+            if value is None:
+                continue
+            # the operand that decides the result, unless the other one draws random values
+            if value != ( kind == 'AND' ):
+                if not compiler.has_random( other ):
+                    return as_tree( value )
+            else:
+                return other
+        return ( kind, left, right )
+
+    return tree
+
+def tree_text( tree ):
+    """
+    Returns the text of a tree that parses into the same tree
+
+    >>> tree_text( compiler.parse_expression( tokenizer.tokenize( 'not (A or B) and (C or D) or E' )[0] ) )
+    'not (A or B) and (C or D) or E'
+    """
+    kind = tree[0]
+    if kind in ( 'ID', 'STATE' ):
+        return tree[1]
+    if kind == 'TUPLE':
+        return '(%s, %s, %s)' % tree[1:]
+    if kind == 'NOT':
+        child = tree_text( tree[1] )
+        if tree[1][0] in ( 'AND', 'OR' ):
+            child = '(%s)' % child
+        return 'not %s' % child
+
+    # the grammar groups the operators from the left
+    left, right = tree_text( tree[1] ), tree_text( tree[2] )
+    if kind == 'AND':
+        if tree[1][0] == 'OR':
+            left = '(%s)' % left
+        if tree[2][0] in ( 'AND', 'OR' ):
+            right = '(%s)' % right
+        return '%s and %s' % (left, right)
+    if tree[2][0] == 'OR':
+        right = '(%s)' % right
+    return '%s or %s' % (left, right)
+
+class Reduction(object):
+    """
+    Reduces a model by removing the nodes that never change
+
+    >>> from boolean2 import boolmodel
+    >>> text = 'A = True\\n B = C = False\\n D = E = Random\\n B* = not A\\n C* = B and D\\n D* = C or E\\n E* = not E'
+    >>> model = boolmodel.BoolModel( mode='sync', text=text )
+    >>> reduction = Reduction( model )
+    >>> sorted( reduction.fixed.items() )
+    [('A', True), ('B', False), ('C', False)]
+    >>> print( reduction.text )
+    D = E = Random
+    1: D* = E
+    1: E* = not E
+    """
+    def __init__(self, model, fixed={}):
+        if model.parser.mode in ( ruleparser.PLDE, ruleparser.TIME ):
+            util.error( 'the network reduction does not support the %s mode' % model.parser.mode )
+
+        self.model = model
+        lexer = tokenizer.get_lexer()
+
+        # the initializers in order, the later assignments win
+        inits, values = [], {}
+        for line in model.init_lines:
+            nodes, tree = compiler.parse_init( lexer.tokenize_line( line ) )
+            inits.append( ( nodes, tree ) )
+            for node in nodes:
+                values[node] = constant( tree )
+
+        # the rules of each node with their ranks
+        rules = {}
+        for rank in model.ranks:
+            for node, tree in compiler.parse_lines( model.update_lines[rank] ):
+                rules.setdefault( node, [] ).append( ( rank, tree ) )
+
+        # start by assuming that every node with a fixed initial value
+        # is frozen, then drop the nodes whose rules may change them
+        forced = dict( (node, bool(value)) for node, value in list(fixed.items()) )
+        self.fixed = dict( (node, value) for node, value in list(values.items()) if value is not None )
+        self.fixed.update( forced )
+        changed = True
+        while changed:
+            changed = False
+            for node in sorted( self.fixed ):
+                if node in forced or node not in rules:
+                    continue
+                consts = [ constant( simplify( tree, self.fixed ) ) for rank, tree in rules[node] ]
+                if any( value != self.fixed[node] for value in consts ):
+                    del self.fixed[node]
+                    changed = True
+
+        self.nodes = [ node for node in sorted( model.nodes ) if node not in self.fixed ]
+
+        # the text of the reduced model
+        lines, present = [], set()
+        for nodes, tree in inits:
+            nodes = [ node for node in reversed( nodes ) if node not in self.fixed ]
+            if nodes:
+                lines.append( '%s = %s' % ( ' = '.join( nodes ), tree_text( tree ) ) )
+                present.update( nodes )
+        for rank in model.ranks:
+            for node, tree in compiler.parse_lines( model.update_lines[rank] ):
+                if node not in self.fixed:
+                    lines.append( '%s: %s* = %s' % ( rank, node, tree_text( simplify( tree, self.fixed ) ) ) )
+                    present.add( node )
+
+        # inputs without initial values that only feed frozen nodes
+        # are kept as free nodes, initialized by the missing values
+        rank = model.ranks and model.ranks[0] or 1
+        for node in self.nodes:
+            if node not in present:
+                lines.append( '%s: %s* = %s' % ( rank, node, node ) )
+        self.text = '\n'.join( lines )
+
+    def reduced(self):
+        "Returns the reduced model"
+        from boolean2 import Model
+        return Model( text=self.text, mode=self.model.parser.mode )
+
+    def report(self):
+        "Returns a short description of the reduction"
+        return 'reduced %d nodes to %d, fixed nodes: %s' % ( len(self.model.nodes), len(self.nodes),
+            ', '.join( '%s=%s' % item for item in sorted( self.fixed.items() ) ) )
+
+    def expand(self, current):
+        "Returns the state of the full model from a state of the reduced model"
+        full = self.model.layout.state()
+        for node, value in list(self.fixed.items()):
+            full[node] = value
+        for node, value in list(current.items()):
+            full[node] = value
+        return full
+
+    def expand_states(self, states):
+        "Returns the states of the full model from the states of the reduced model"
+        layout = self.model.layout
+        base = layout.state()
+        for node, value in list(self.fixed.items()):
+            base[node] = value
+        index = [ layout.index[node] for node in self.nodes ]
+        result = []
+        for current in states:
+            data = bytearray( base.data )
+            for pos, value in zip( index, current.data ):
+                data[pos] = value
+            result.append( layout.state( data ) )
+        return result
+
+    def expand_values(self, values):
+        """
+        Returns the values of the full model from the values of the reduced model
+        in an array with the nodes in the last axis, as produced by the batch engines
+        """
+        import numpy
+        layout = self.model.layout
+        values = numpy.asarray( values, dtype=bool )
+        full = numpy.empty( values.shape[:-1] + ( layout.size, ), dtype=bool )
+        for node, value in list(self.fixed.items()):
+            full[..., layout.index[node]] = value
+        full[..., [ layout.index[node] for node in self.nodes ]] = values
+        return full
+
+def test():
+    """
+    Main testrunnner
+    """
+    import doctest
+    doctest.testmod()
+
+if __name__ == '__main__':
+    test()
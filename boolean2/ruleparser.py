@@ -108,6 +108,28 @@ def p_error(p):
     msg = "Syntax error in -> '%s'" % LAST_LINE
     util.error( msg )
 
+# parser attributes that hold the settings of a model
+SETTINGS = 'mode sync RULE_AND RULE_OR RULE_NOT RULE_SETVALUE RULE_GETVALUE RULE_START_ITERATION'.split()
+
+# the parsing tables are generated on the first use only
+# and are shared by all parsers
+LR_TABLE = None
+
+def new_parser():
+    """
+    Returns a new parser object. Building the LALR tables from the grammar
+    is slow so it is done only once, each parser receives the same tables 
+    but keeps its own settings and state.
+    """
+    global LR_TABLE
+    if LR_TABLE is None:
+        proto = yacc.yacc( write_tables=0, debug=0 )
+        table = yacc.LRTable()
+        table.lr_action, table.lr_goto = proto.action, proto.goto
+        table.lr_productions = proto.productions
+        LR_TABLE = table
+    return yacc.LRParser( LR_TABLE, p_error )
+
 class Parser(object):
     "Represents a boolean parser"
     def __init__(self, mode, text ):
@@ -120,7 +142,7 @@ class Parser(object):
             util.error( 'mode parameter must be one of %s' % VALID_MODES)
 
         # initialize the parsers
-        self.parser = yacc.yacc( write_tables=0, debug=0 )
+        self.parser = new_parser()
         
         # set the mode
         self.parser.mode  = mode
@@ -128,23 +150,15 @@ class Parser(object):
         # optimization: this check is used very often 
         self.parser.sync = (self.parser.mode == SYNC or self.parser.mode == TIME)
 
-        # define default functions
-        def get_value(state, name, p):
-            return  getattr( state, name )
-
-        def set_value(state, name, value, p):
-            setattr( state, name, value )
-            return value
-
         #
         # setting the default rules
         #
-        self.parser.RULE_AND = lambda a, b, p: a and b
-        self.parser.RULE_OR  = lambda a, b, p: a or b
-        self.parser.RULE_NOT = lambda a, p: not a
-        self.parser.RULE_SETVALUE = set_value
-        self.parser.RULE_GETVALUE = get_value
-        self.parser.RULE_START_ITERATION = lambda index, model: index
+        self.parser.RULE_AND = util.default_and
+        self.parser.RULE_OR  = util.default_or
+        self.parser.RULE_NOT = util.default_not
+        self.parser.RULE_SETVALUE = util.default_set_value
+        self.parser.RULE_GETVALUE = util.default_get_value
+        self.parser.RULE_START_ITERATION = util.default_start_iteration
 
         #
         # internally we'll maintain a full list of tokens 
@@ -1,7 +1,36 @@
 """
 Classes to represent state of the simulation
 """
+import hashlib, struct
 from itertools import *
+from boolean2 import util
+
+# states with up to this many nodes are fingerprinted by their bits
+CODE_BITS = 64
+
+# multiplying a word of eight 0/1 bytes gathers them in its highest byte
+GATHER = 0x0102040810204080
+
+# unpacks the big endian words of the states that get integer fingerprints
+WORDS = [ struct.Struct( '>%dQ' % count ) for count in range( CODE_BITS // 8 + 1 ) ]
+
+def pack_bits( data ):
+    """
+    Returns the integer that has the 0/1 bytes as bits, 
+    with the first byte as the highest bit, for up to 64 bytes
+
+    >>> pack_bits( bytearray( [1, 0, 1] ) )
+    5
+    """
+    pad  = -len(data) % 8
+    code = 0
+    for word in WORDS[ ( len(data) + pad ) // 8 ].unpack( bytes(pad) + data ):
+        code = code << 8 | ( word * GATHER >> 56 ) & 0xff
+    return code
+
+def stable_hash( data ):
+    "A 64 bit hash of a byte string that is the same in every process"
+    return int.from_bytes( hashlib.blake2b( data, digest_size=8 ).digest(), 'big' )
 
 class State(object):
     """
@@ -11,12 +40,9 @@ class State(object):
     >>> state.a = 1
     >>> state
     State: a=1, b=0, c=1
-    >>> state.fp()
-    0
     >>> state.bin()
     '101'
     """
-    MAPPER, COUNTER  = {}, 0
 
     def __init__(self, **kwds ):
         self.__dict__.update( kwds )
@@ -57,21 +83,182 @@ class State(object):
         return self.__dict__ == other.__dict__
 
     def fp(self):
-        "Returns a unique user friendly state definition"
-        
-        value = hash( str(self) )
-        
-        if value not in State.MAPPER:
-            State.MAPPER[value] = State.COUNTER
-            State.COUNTER += 1
-
-        return State.MAPPER[value]
+        """
+        Returns a fingerprint of the state, a 64 bit integer that only 
+        depends on the node names and values
+        """
+        return stable_hash( str(self).encode() )
     
     def bin( self ):
         "A binary representation of the states"
         values = list(map(str, list(map(int, list(self.values())))))
         return ''.join(values)
 
+class Layout(object):
+    """
+    Maps the node names to fixed indices. 
+    It is created once per model and shared by all of its states.
+
+    >>> layout = Layout( [ 'B', 'A', 'C' ] )
+    >>> layout.nodes
+    ['A', 'B', 'C']
+    >>> state = layout.state()
+    >>> state.B = True
+    >>> state
+    State: A=False, B=True, C=False
+    >>> state['B'], state.bin()
+    (True, '010')
+    """
+    def __init__(self, nodes):
+        self.nodes = list(sorted(nodes))
+        self.index = dict( (node, index) for index, node in enumerate(self.nodes) )
+        self.size  = len(self.nodes)
+
+    def state(self, data=None):
+        "Returns a new state, all nodes are False unless the data is specified"
+        if data is None:
+            data = bytearray( self.size )
+        return IndexedState( self, data )
+
+    def __len__(self):
+        return self.size
+
+    def __eq__(self, other):
+        return isinstance(other, Layout) and self.nodes == other.nodes
+
+    def __hash__(self):
+        return hash( tuple(self.nodes) )
+
+# translates the stored 0/1 bytes into characters
+BIN_TABLE = bytes.maketrans( bytes([0, 1]), b'01' )
+
+class IndexedState(object):
+    """
+    Represents a boolean state as a vector of bytes, one byte 
+    for each node in the order given by the layout.
+
+    Works like the State class, the nodes may be accessed 
+    as attributes or by name.
+    """
+    __slots__ = ( 'layout', 'data' )
+
+    def __init__(self, layout, data):
+        object.__setattr__( self, 'layout', layout )
+        object.__setattr__( self, 'data', data )
+
+    def __getattr__(self, name):
+        # only invoked for the names that are not slots
+        if name in IndexedState.__slots__:
+            raise AttributeError( name )
+        try:
+            return self.data[ self.layout.index[name] ] == 1
+        except KeyError:
+            raise AttributeError( "state has no node named '%s'" % name )
+
+    def __setattr__(self, name, value):
+        try:
+            self.data[ self.layout.index[name] ] = bool(value)
+        except KeyError:
+            raise AttributeError( "state has no node named '%s'" % name )
+
+    def __getitem__(self, key):
+        return self.data[ self.layout.index[key] ] == 1
+
+    def __setitem__(self, key, value):
+        self.data[ self.layout.index[key] ] = bool(value)
+
+    def __repr__(self):  
+        "Default string format"
+        items = [ '%s=%s' % x for x in list(self.items()) ]
+        items = ', '.join(items)
+        return 'State: %s' % items
+
+    def __reduce__(self):
+        return ( IndexedState, (self.layout, self.data) )
+
+    def items(self):
+        "Returns the nodes and values in sorted order"
+        return list(zip( self.layout.nodes, self.values() ))
+
+    def keys(self):
+        "Returns the sorted keys"
+        return list(self.layout.nodes)
+
+    def values(self):
+        "Returns the values by sorted keys"
+        return [ value == 1 for value in self.data ]
+
+    def __iter__(self):
+        return iter( self.layout.nodes )
+
+    def copy(self):
+        "Duplicates itself"
+        return IndexedState( self.layout, bytearray(self.data) )
+
+    def __eq__(self, other):
+        if isinstance(other, IndexedState):
+            return self.data == other.data and self.layout == other.layout
+        return list(self.items()) == list(other.items())
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def fp(self):
+        """
+        Returns a fingerprint of the state. For networks with up to 
+        64 nodes it is the integer that has the node values as bits, 
+        with the first node as the highest bit. Larger networks
+        get a 64 bit hash of the values.
+
+        >>> layout = Layout( [ 'A', 'B', 'C' ] )
+        >>> layout.state( bytearray( [1, 0, 1] ) ).fp()
+        5
+        """
+        if self.layout.size <= CODE_BITS:
+            return pack_bits( self.data )
+        return stable_hash( bytes(self.data) )
+    
+    def bin( self ):
+        "A binary representation of the states"
+        return bytes( self.data ).translate( BIN_TABLE ).decode( 'ascii' )
+
+class Labels(object):
+    """
+    Assigns small consecutive numbers to the states in the order
+    in which they are first seen, a user friendly alternative to 
+    the fingerprints. Each model has its own table, it holds 
+    at most limit states.
+
+    >>> layout = Layout( [ 'A', 'B' ] )
+    >>> labels = Labels( limit=2 )
+    >>> [ labels( layout.state( bytearray(data) ) ) for data in ( [1, 1], [0, 0], [1, 1] ) ]
+    [0, 1, 0]
+    >>> len(labels)
+    2
+    """
+    def __init__(self, limit=100000):
+        self.limit = limit
+        self.store = {}
+
+    def __call__(self, state):
+        key = state.fp()
+        try:
+            return self.store[key]
+        except KeyError:
+            if len(self.store) >= self.limit:
+                util.error( 'more than %d labeled states, use the fingerprints instead' % self.limit )
+            value = self.store[key] = len(self.store)
+            return value
+
+    def __len__(self):
+        return len(self.store)
+
+    def clear(self):
+        "Forgets all labels"
+        self.store.clear()
+
 def bit2int(bits):
     """
     Returns the integer corresponding of a bit state. 
@@ -94,7 +281,7 @@ def int2bit(x, w=20):
     bits = [ ]
     while x:
         bits.append(x%2)
-        x /= 2
+        x //= 2
     
     # a bit of padding
     bits = bits + [ 0 ] * w
@@ -0,0 +1,491 @@
+"""
+Exhaustive analysis of the state space
+
+The states are encoded as integers, the value of the first node
+is the highest bit, the same as in the fingerprints of the states.
+The successors of the states are computed with the vectorized rules.
+
+In the synchronous mode every state has one successor, these
+are stored in a transition table that is indexed by the state codes.
+In the asynchronous mode the successors are stored in compressed
+sparse row form, the attractors are the terminal strongly
+connected components of this graph.
+"""
+from boolean2 import util, ruleparser, compiler
+from boolean2.batch import SyncEngine, AsyncEngine
+
+try:
+    import numpy
+except ImportError as exc:
+    util.error( f"numpy import error : {exc}. Install it from https://numpy.org/" )
+
+# the transition table has 2**size entries
+MAX_NODES = 32
+
+def check_model( model, mode, limit=MAX_NODES ):
+    "Verifies that the state space of the model can be built"
+    if model.parser.mode != mode:
+        util.error( 'the state space of the %s mode cannot be built with the %s mode' % (model.parser.mode, mode) )
+
+    size = len(model.nodes)
+    if size > limit:
+        util.error( 'the state space of %d nodes is too large, at most %d nodes are supported' % (size, limit) )
+
+    for lines in list(model.update_lines.values()):
+        for node, tree in compiler.parse_lines( lines ):
+            if compiler.has_random( tree ):
+                util.error( 'the rule of node %s has a Random value, the transitions are not unique' % node )
+
+def code_type( size ):
+    "The smallest unsigned type that holds the codes"
+    return size <= 32 and numpy.uint32 or numpy.uint64
+
+def encode( values ):
+    """
+    Returns the codes of the rows in a boolean array
+    of shape (nodes, states)
+
+    >>> encode( numpy.array( [ [1, 0], [0, 0], [1, 1] ], dtype=bool ) ).tolist()
+    [5, 1]
+    """
+    codes = numpy.zeros( values.shape[1], dtype=code_type( len(values) ) )
+    for row in values:
+        codes <<= 1
+        codes |= row
+    return codes
+
+def decode( codes, size ):
+    "Returns the boolean array of shape (nodes, states) of the codes"
+    shifts = numpy.arange( size-1, -1, -1, dtype=codes.dtype )
+    return ( ( codes[None, :] >> shifts[:, None] ) & 1 ).astype( bool )
+
+def decode_states( layout, codes ):
+    "Returns the states of a layout that correspond to the codes"
+    codes  = numpy.asarray( codes, dtype=code_type( layout.size ) )
+    values = decode( codes, layout.size ).T.astype( numpy.uint8 )
+    return [ layout.state( bytearray( row.tobytes() ) ) for row in values ]
+
+def functional_cycles( succ ):
+    """
+    Finds the cycles of a functional graph where the successor of node i
+    is succ[i]. Returns a list of cycles, each starting with its smallest
+    node, ordered by that node, and an array with the index of the cycle
+    that each node leads to.
+
+    Nodes that have no predecessors are peeled off in rounds, what
+    remains are the cycles. The cycle labels are then passed back
+    over the peeled nodes in the reverse order. Each node is
+    visited a fixed number of times.
+
+    >>> cycles, labels = functional_cycles( numpy.array( [1, 2, 1, 3, 3] ) )
+    >>> cycles
+    [[1, 2], [3]]
+    >>> labels.tolist()
+    [0, 0, 0, 1, 1]
+    """
+    succ  = numpy.asarray( succ, dtype=numpy.int64 )
+    size  = len(succ)
+    indeg = numpy.bincount( succ, minlength=size )
+
+    # the transient nodes, round by round
+    rounds = []
+    front  = numpy.flatnonzero( indeg == 0 )
+    while len(front):
+        rounds.append( front )
+        targets, counts = numpy.unique( succ[front], return_counts=True )
+        indeg[targets] -= counts
+        front = targets[ indeg[targets] == 0 ]
+
+    # the remaining nodes are on cycles, fixed points need no walking
+    labels = numpy.full( size, -1, dtype=numpy.int64 )
+    nodes  = numpy.flatnonzero( indeg > 0 )
+    fixed  = nodes[ succ[nodes] == nodes ]
+    cycles = [ [ int(node) ] for node in fixed ]
+    for node in nodes[ succ[nodes] != nodes ]:
+        if labels[node] >= 0:
+            continue
+        # nodes are visited in increasing order, so this is the smallest node
+        cycle = [ int(node) ]
+        labels[node] = 0
+        next = succ[node]
+        while next != node:
+            labels[next] = 0
+            cycle.append( int(next) )
+            next = succ[next]
+        cycles.append( cycle )
+
+    cycles.sort()
+    for index, cycle in enumerate( cycles ):
+        labels[cycle] = index
+
+    for front in reversed( rounds ):
+        labels[front] = labels[ succ[front] ]
+
+    return cycles, labels
+
+class StateSpace(object):
+    """
+    The complete synchronous transition table of a model
+
+    >>> from boolean2 import boolmodel
+    >>> model = boolmodel.BoolModel( mode='sync', text='A* = B\\n B* = A\\n C* = A or C' )
+    >>> space = StateSpace( model )
+    >>> space.table.tolist()
+    [0, 1, 4, 5, 3, 3, 7, 7]
+    >>> space.attractors()
+    [[0], [1], [3, 5], [7]]
+    >>> space.basin_sizes().tolist()
+    [1, 1, 4, 2]
+    >>> [ state.bin() for state in space.states( [3, 5] ) ]
+    ['011', '101']
+    """
+    def __init__(self, model, chunk=2**16):
+        check_model( model, ruleparser.SYNC )
+        self.model  = model
+        self.layout = model.layout
+        self.nodes  = model.layout.nodes
+        self.size   = len(model.nodes)
+        self.engine = SyncEngine( model )
+        self.table  = self.transitions( chunk )
+        self.cycles = self.labels = None
+
+    def transitions(self, chunk):
+        "Computes the code of the successor of each state in chunks"
+        count = 2 ** self.size
+        dtype = code_type( self.size )
+        table = numpy.empty( count, dtype=dtype )
+        for start in range(0, count, chunk):
+            codes = numpy.arange( start, min(start+chunk, count), dtype=dtype )
+            x   = decode( codes, self.size )
+            out = x.copy()
+            for rank in self.model.ranks:
+                self.engine.funcs[rank]( x, out, len(codes) )
+            table[start:start+len(codes)] = encode( out )
+        return table
+
+    def analyze(self):
+        "Finds the attractors and the basins"
+        if self.cycles is None:
+            self.cycles, self.labels = functional_cycles( self.table )
+        return self.cycles, self.labels
+
+    def attractors(self):
+        """
+        Returns the attractors as lists of state codes, each starts with
+        its smallest code, a steady state is a list with one code
+        """
+        return self.analyze()[0]
+
+    def basins(self):
+        "Returns an array with the index of the attractor that each state leads to"
+        return self.analyze()[1]
+
+    def basin_sizes(self):
+        "Returns the number of states that lead to each attractor"
+        cycles, labels = self.analyze()
+        return numpy.bincount( labels, minlength=len(cycles) )
+
+    def code(self, state):
+        "Returns the code of a state"
+        return state.fp()
+
+    def states(self, codes):
+        "Returns the states that correspond to the codes"
+        return decode_states( self.layout, codes )
+
+def strong_components( indptr, indices ):
+    """
+    Finds the strongly connected components of a graph in compressed 
+    sparse row form with an iterative version of Tarjan's algorithm.
+    Returns the number of components and an array with the component 
+    of each node. The components are numbered in reverse topological 
+    order, no edge leads from a component to one with a higher number.
+
+    >>> count, comps = strong_components( numpy.array( [0, 1, 2, 4, 4] ), numpy.array( [1, 0, 0, 3] ) )
+    >>> count, comps.tolist()
+    (3, [0, 0, 2, 1])
+    """
+    size = len(indptr) - 1
+    indptr, indices = indptr.tolist(), indices.tolist()
+    index = [ -1 ] * size
+    low   = [ 0 ] * size
+    comps = [ -1 ] * size
+    stack, counter, count = [], 0, 0
+
+    for root in range(size):
+        if index[root] >= 0:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append( root )
+        work = [ ( root, indptr[root] ) ]
+        while work:
+            node, pos = work[-1]
+            end = indptr[node+1]
+            while pos < end:
+                next = indices[pos]
+                pos += 1
+                if index[next] < 0:
+                    break
+                # visited nodes without a component are on the stack
+                if comps[next] < 0 and index[next] < low[node]:
+                    low[node] = index[next]
+            else:
+                # all successors of the node have been visited
+                work.pop()
+                if low[node] == index[node]:
+                    while 1:
+                        other = stack.pop()
+                        comps[other] = count
+                        if other == node:
+                            break
+                    count += 1
+                if work:
+                    parent = work[-1][0]
+                    if low[node] < low[parent]:
+                        low[parent] = low[node]
+                continue
+
+            # descend into the unvisited successor
+            work[-1] = ( node, pos )
+            index[next] = low[next] = counter
+            counter += 1
+            stack.append( next )
+            work.append( ( next, indptr[next] ) )
+
+    return count, numpy.array( comps, dtype=numpy.int64 )
+
+class AsyncStateSpace(object):
+    """
+    The complete asynchronous state transition graph of a model.
+    Each rule that changes the value of its node in a state 
+    leads to a successor of the state.
+
+    >>> from boolean2 import boolmodel
+    >>> model = boolmodel.BoolModel( mode='async', text='A* = B\\n B* = A\\n C* = not C' )
+    >>> space = AsyncStateSpace( model )
+    >>> space.successors( 0 ).tolist()
+    [1]
+    >>> space.attractors()
+    [[0, 1], [6, 7]]
+    >>> [ state.bin() for state in space.states( [6, 7] ) ]
+    ['110', '111']
+    """
+    def __init__(self, model, chunk=2**16):
+        check_model( model, ruleparser.ASYNC )
+        self.model  = model
+        self.layout = model.layout
+        self.nodes  = model.layout.nodes
+        self.size   = len(model.nodes)
+        self.engine = AsyncEngine( model )
+        self.indptr, self.indices = self.transitions( chunk )
+        self.count = self.comps = None
+
+    def transitions(self, chunk):
+        """
+        Computes the successors of each state in chunks, returns the 
+        compressed sparse row arrays, the successors of state i are
+        indices[indptr[i]:indptr[i+1]]
+        """
+        count = 2 ** self.size
+        dtype = code_type( self.size )
+        rules = [ rule for rank in self.model.ranks for rule in self.engine.rules[rank] ]
+        bits  = numpy.array( [ 1 << (self.size - 1 - row) for row, func in rules ], dtype=dtype )
+
+        counts  = numpy.empty( count, dtype=numpy.int64 )
+        indices = []
+        for start in range(0, count, chunk):
+            codes = numpy.arange( start, min(start+chunk, count), dtype=dtype )
+            x = decode( codes, self.size )
+
+            # the rules that change the value of their node
+            flips = numpy.empty( ( len(codes), len(rules) ), dtype=bool )
+            for column, ( row, func ) in enumerate( rules ):
+                numpy.not_equal( func( x, slice(None), len(codes) ), x[row], out=flips[:, column] )
+
+            states, columns = numpy.nonzero( flips )
+            indices.append( codes[states] ^ bits[columns] )
+            counts[start:start+len(codes)] = flips.sum( axis=1 )
+
+        indptr = numpy.zeros( count+1, dtype=numpy.int64 )
+        numpy.cumsum( counts, out=indptr[1:] )
+        return indptr, numpy.concatenate( indices )
+
+    def successors(self, code):
+        "Returns the codes of the successors of a state"
+        return self.indices[ self.indptr[code]:self.indptr[code+1] ]
+
+    def components(self):
+        "Returns the number of strongly connected components and the component of each state"
+        if self.comps is None:
+            self.count, self.comps = strong_components( self.indptr, self.indices )
+        return self.count, self.comps
+
+    def terminal(self):
+        "Returns the sorted numbers of the components that no edge leaves"
+        count, comps = self.components()
+        sources = numpy.repeat( comps, numpy.diff( self.indptr ) )
+        leaving = sources != comps[ self.indices ]
+        return numpy.setdiff1d( numpy.arange( count ), sources[leaving] )
+
+    def attractors(self):
+        """
+        Returns the attractors, the terminal strongly connected components,
+        as sorted lists of state codes ordered by their smallest code
+        """
+        count, comps = self.components()
+        terminal = self.terminal()
+        order = numpy.argsort( comps, kind='stable' )
+        ends  = numpy.cumsum( numpy.bincount( comps, minlength=count ) )
+        result = []
+        for comp in terminal:
+            start = comp and ends[comp-1] or 0
+            result.append( order[start:ends[comp]].tolist() )
+        result.sort()
+        return result
+
+    def attractor_sizes(self):
+        "Returns the number of states in each attractor"
+        return [ len(states) for states in self.attractors() ]
+
+    def states(self, codes):
+        "Returns the states that correspond to the codes"
+        return decode_states( self.layout, codes )
+
+def dependency_graph( model ):
+    """
+    Returns the edges from the inputs of each rule to the node
+    that the rule sets as an array of node index pairs
+    """
+    index = model.layout.index
+    edges = []
+    for rank in model.ranks:
+        for node, tree in compiler.parse_lines( model.update_lines[rank] ):
+            edges.extend( ( index[other], index[node] ) for other in sorted( compiler.get_inputs( tree ) ) )
+    return numpy.array( edges, dtype=numpy.int64 ).reshape( -1, 2 )
+
+def modules( model ):
+    """
+    Returns the strongly connected components of the dependency graph
+    as lists of nodes, every module comes after the modules of its inputs
+    """
+    size  = len(model.layout.nodes)
+    edges = dependency_graph( model )
+    order = numpy.argsort( edges[:, 0], kind='stable' )
+    indptr = numpy.zeros( size+1, dtype=numpy.int64 )
+    numpy.cumsum( numpy.bincount( edges[:, 0], minlength=size ), out=indptr[1:] )
+    count, comps = strong_components( indptr, edges[order, 1] )
+
+    # the components are numbered with the downstream ones first
+    groups = [ [] for comp in range(count) ]
+    for node, comp in zip( model.layout.nodes, comps.tolist() ):
+        groups[comp].append( node )
+    groups.reverse()
+    return groups
+
+class ModularStateSpace(object):
+    """
+    Finds the synchronous attractors module by module. 
+
+    The modules are the strongly connected components of the dependency
+    graph of the rules, processed so that the inputs of each module are 
+    already known. The attractors of the processed nodes drive the next 
+    module: for an attractor of period p the module is simulated from
+    every combination of the phase of the attractor and the state of the 
+    module, the cycles of this driven system are the attractors of the 
+    processed nodes and the module together. Each module needs at most 
+    limit states to be simulated for each attractor that drives it.
+
+    >>> from boolean2 import boolmodel
+    >>> text = 'A* = not A\\n B* = A\\n C* = B and C\\n D* = D'
+    >>> model = boolmodel.BoolModel( mode='sync', text=text )
+    >>> space = ModularStateSpace( model )
+    >>> space.modules
+    [['D'], ['A'], ['B'], ['C']]
+    >>> space.attractors() == StateSpace( model ).attractors()
+    True
+    """
+    def __init__(self, model, limit=2**22):
+        check_model( model, ruleparser.SYNC, limit=64 )
+        self.model   = model
+        self.layout  = model.layout
+        self.nodes   = model.layout.nodes
+        self.size    = len(model.nodes)
+        self.limit   = limit
+        self.engine  = SyncEngine( model )
+        self.modules = modules( model )
+        self.cycles  = None
+
+    def drive(self, module, func, cycle):
+        """
+        Returns the attractors of a module driven by an attractor of the 
+        processed nodes, the attractors are arrays of shape (period, nodes)
+        """
+        rows   = [ self.layout.index[node] for node in module ]
+        period = len(cycle)
+        width  = len(rows)
+        count  = period * 2 ** width
+        if count > self.limit:
+            util.error( 'the module of %d nodes driven by an attractor of period %d has too many states' % (width, period) )
+
+        # the column of a combination is phase * 2**width + state
+        codes  = numpy.arange( count, dtype=numpy.int64 )
+        phases, states = codes >> width, codes & ( 2 ** width - 1 )
+        x = numpy.array( cycle[phases].T, order='C' )
+        x[rows] = decode( states.astype( numpy.uint64 ), width )
+        out = x.copy()
+        func( x, out, count )
+        succ = ( ( phases + 1 ) % period ) * 2 ** width + encode( out[rows] ).astype( numpy.int64 )
+
+        result = []
+        for combos in functional_cycles( succ )[0]:
+            combos = numpy.array( combos, dtype=numpy.int64 )
+            values = cycle[ combos >> width ]
+            values[:, rows] = decode( ( combos & ( 2 ** width - 1 ) ).astype( numpy.uint64 ), width ).T
+            result.append( values )
+        return result
+
+    def analyze(self):
+        "Finds the attractors module by module"
+        if self.cycles is None:
+            index = self.layout.index
+            lines = {}
+            for rank in self.model.ranks:
+                for line, ( node, tree ) in zip( self.model.update_lines[rank], compiler.parse_lines( self.model.update_lines[rank] ) ):
+                    lines.setdefault( node, [] ).append( line )
+
+            cycles = [ numpy.zeros( (1, self.size), dtype=bool ) ]
+            for pos, module in enumerate( self.modules ):
+                func = self.engine.compile( '_module%d' % pos, [ line for node in module for line in lines.get( node, [] ) ] )
+                cycles = [ result for cycle in cycles for result in self.drive( module, func, cycle ) ]
+
+            # the same form as the attractors of the state space
+            self.cycles = []
+            for cycle in cycles:
+                codes = encode( cycle.T ).tolist()
+                start = codes.index( min(codes) )
+                self.cycles.append( codes[start:] + codes[:start] )
+            self.cycles.sort()
+
+        return self.cycles
+
+    def attractors(self):
+        """
+        Returns the attractors as lists of state codes, each starts with
+        its smallest code, a steady state is a list with one code
+        """
+        return self.analyze()
+
+    def states(self, codes):
+        "Returns the states that correspond to the codes"
+        return decode_states( self.layout, codes )
+
+def test():
+    """
+    Main testrunnner
+    """
+    import doctest
+    doctest.testmod()
+
+if __name__ == '__main__':
+    test()
@@ -16,6 +16,15 @@ class TimeModel( BoolModel ):
         self.step  = 0
         self.times = [ 0 ]
 
+        # the update schedule repeats after this many steps
+        self.period = util.list_lcm( self.ranks ) // self.gcd
+
+    def reset(self, values=None):
+        "Resets the TimeModel to its initial state"
+        BoolModel.reset( self, values )
+        self.step  = 0
+        self.times = [ 0 ]
+
     def __next__(self):
         "Generates the updates based on the next simulation step"
         self.step += 1
@@ -42,16 +51,26 @@ class TimeModel( BoolModel ):
 
         return rules
 
+    def state_key( self, current ):
+        "The next state also depends on the position in the update schedule"
+        return bytes( current.data ), self.step % self.period
+
+    def update( self, shuffler ):
+        "Executes the rules that are due in the next time step"
+        lines = shuffler( )
+        self.execute( lines )
+
     def iterate( self, steps, shuffler=None, **kwds ):
         """
         Iterates over the lines 'steps' times. 
         """
         shuffler = shuffler or self.shuffler
-        for index in range(steps):
-            self.parser.RULE_START_ITERATION( index, self )
-            BoolModel.state_update(self)
-            lines = shuffler( )
-            list(map( self.local_parse, lines )) 
+        return BoolModel.iterate( self, steps, shuffler=shuffler, **kwds )
+
+    def iterate_stream( self, steps, shuffler=None ):
+        "Generates the new state after each step without storing the states"
+        shuffler = shuffler or self.shuffler
+        return BoolModel.iterate_stream( self, steps, shuffler=shuffler )
 
 if __name__ == '__main__':
     
@@ -32,6 +32,12 @@ class Lexer:
         # nothing here yet
         self.lexer = lex.lex(object=self, **kwargs)
 
+    def clone(self):
+        "Returns a new lexer that shares the tables of this one"
+        other = self.__class__.__new__( self.__class__ )
+        other.lexer = self.lexer.clone( other )
+        return other
+
     def t_ID( self, t):
         "[a-zA-Z_\+\-][a-zA-Z_0-9\+\-]*"
 
@@ -181,9 +187,19 @@ def test():
     import doctest
     doctest.testmod( optionflags=doctest.ELLIPSIS + doctest.NORMALIZE_WHITESPACE )
 
+# building the lexer tables is slow, they are built once and shared by the clones
+LEXER = None
+
+def get_lexer():
+    "Returns a new lexer, the tables are built upon the first call"
+    global LEXER
+    if LEXER is None:
+        LEXER = Lexer()
+    return LEXER.clone()
+
 def tokenize( text ):
     "A one step tokenizer"
-    lexer = Lexer()
+    lexer = get_lexer()
     return lexer.tokenize_text( text )
 
 def modify_states( text, turnon=[], turnoff=[] ):
@@ -30,6 +30,31 @@ def warn(msg):
     "Prints a warning message"
     print('*** warning: %s' % msg)
  
+def default_and( a, b, p ):
+    "Default AND operator"
+    return a and b
+
+def default_or( a, b, p ):
+    "Default OR operator"
+    return a or b
+
+def default_not( a, p ):
+    "Default NOT operator"
+    return not a
+
+def default_get_value( state, name, p ):
+    "Default value getter"
+    return getattr( state, name )
+
+def default_set_value( state, name, value, p ):
+    "Default value setter"
+    setattr( state, name, value )
+    return value
+
+def default_start_iteration( index, model ):
+    "Default iteration hook"
+    return index
+
 def tuple_to_bool( value ):
     """
     Converts a value triplet to boolean values
@@ -102,6 +127,10 @@ def list_gcd( data ):
     else:
         return pair_gcd( data[0], list_gcd( data[1:] ))
 
+def list_lcm( data ):
+    "Least common multiple of all elements of a list"
+    return reduce( lambda a, b: a * b // pair_gcd(a, b), data )
+
 def as_set( nodes ):
     "Wraps input into a set if needed. Allows single input or any iterable"
     if isinstance(nodes, str):
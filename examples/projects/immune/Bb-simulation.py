@@ -36,7 +36,8 @@ def local_override( node, indexer, tokens ):
 #
 # there will be two models, one for WT and the other for a BC knockout
 #
-wt_text = file('Bb.txt').read()
+with open( 'Bb.txt' ) as fp:
+    wt_text = fp.read()
 bc_text = boolean2.modify_states( text=wt_text, turnoff= [ "BC"  ] )
 
 model1 = Model( text=wt_text, mode='plde' )
@@ -12,6 +12,9 @@ rules = """
 # create the model
 model = boolean2.Model( text=rules, mode='async')
 
+# the initializers are executed only once, the resets below reuse the initial state
+model.initialize( missing=util.false )
+
 # generates all states, set limit to a value to keep only the first that many states
 # when limit is a number it will take the first that many initial states
 initializer = state.all_initial_states( model.nodes, limit=None )
@@ -20,5 +23,5 @@ initializer = state.all_initial_states( model.nodes, limit=None )
 for data, initfunc in initializer:
     # shows the initial values
     print(data)
-    model.initialize(missing=initfunc)
+    model.reset( data )
     model.iterate(5)
@@ -2,7 +2,7 @@ import unittest
 from  tests import testbase
 
 # these are the module names that will be tested
-modules = "test_sync"
+modules = "test_sync test_compiler test_batch test_statespace test_network test_reduction test_plde"
 
 def get_suite():
     suite = unittest.TestSuite()
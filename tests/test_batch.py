@@ -0,0 +1,131 @@
+"""
+Testing the vectorized engines
+"""
+import sys, unittest
+
+from tests import testbase
+
+import numpy
+import boolean2
+from boolean2 import util, batch
+
+TEXT = """
+A = True
+B = C = D = False
+B* = A or C
+C* = A and not D
+D* = B and C
+E* = not (D or E)
+"""
+
+TIMED = """
+A = True
+B = C = False
+1: B* = A and not C
+2: C* = B
+3: A* = not C
+"""
+
+def regular_states( mode, text, values, nodes, steps ):
+    "Simulates each initial value with the regular engine"
+    result = []
+    for row in values:
+        model = boolean2.Model( mode=mode, text=text )
+        model.initialize( missing=util.false, defaults=dict( zip(nodes, row) ) )
+        model.iterate( steps=steps )
+        result.append( [ state.values() for state in model.states ] )
+    return numpy.array( result ).transpose( 1, 0, 2 )
+
+class BatchTest( testbase.TestBase ):
+
+    def test_all_states( self ):
+        "Testing all states"
+        values = batch.all_states( 3 )
+        self.EQ( values.shape, (8, 3) )
+        self.EQ( values[5].tolist(), [ True, False, True ] )
+
+    def test_sync_engine( self ):
+        "Testing the synchronous engine against the regular engine"
+        model = boolean2.Model( mode='sync', text=TEXT )
+        model.initialize( missing=util.false )
+        engine = batch.SyncEngine( model )
+        values = engine.initial_states( nodes=model.nodes )
+        traj   = engine.iterate( values, steps=6 )
+        self.EQ( traj.shape, (7, 32, 5) )
+
+        expected = regular_states( 'sync', TEXT, values, engine.nodes, steps=6 )
+        self.EQ( traj.tolist(), expected.tolist() )
+
+        avgs = engine.averages( values, steps=6 )
+        self.EQ( avgs['A'].tolist(), traj[:, :, 0].mean( axis=1 ).tolist() )
+
+    def test_async_engine( self ):
+        "Testing the asynchronous engine against the regular engine with the same update orders"
+        model  = boolean2.Model( mode='async', text=TEXT )
+        engine = batch.AsyncEngine( model, seed=5 )
+        values = engine.initial_values( 20, missing=util.randbool )
+        steps  = 4
+
+        # record the orders drawn by the engine
+        drawn = []
+        orders = engine.orders
+        def record( count, size ):
+            result = orders( count, size )
+            drawn.append( result )
+            return result
+        engine.orders = record
+        traj = engine.iterate( values, steps=steps )
+        
+        lines = model.update_lines[1]
+        for rep, row in enumerate( values ):
+            # the shuffler replays the orders of the replicate
+            replay = iter( [ [ lines[i] for i in order[:, rep] ] for order in drawn ] )
+            shuffler = lambda lines: next( replay )
+
+            model.initialize( missing=util.false, defaults=dict( zip(engine.nodes, row) ) )
+            model.iterate( steps=steps, shuffler=shuffler )
+            expected = [ state.values() for state in model.states ]
+            self.EQ( traj[:, rep, :].tolist(), expected )
+
+    def test_bit_engine( self ):
+        "Testing the bit packed engine against the synchronous engine"
+        for mode, text in ( ( 'sync', TEXT ), ( 'time', TIMED ) ):
+            model  = boolean2.Model( mode=mode, text=text )
+            model.initialize( missing=util.false )
+            values = numpy.random.default_rng( 1 ).random( (130, len(model.nodes)) ) < 0.5
+            engine = batch.BitEngine( model )
+            self.EQ( engine.unpack( engine.pack( values ), 130 ).tolist(), values.tolist() )
+
+            expected = batch.SyncEngine( model ).iterate( values, steps=6 )
+            self.EQ( engine.iterate( values, steps=6 ).tolist(), expected.tolist() )
+            self.EQ( engine.run( values, steps=6 ).tolist(), expected[-1].tolist() )
+            avgs = engine.averages( values, steps=6 )
+            self.EQ( avgs['B'].tolist(), expected[:, :, 1].mean( axis=1 ).tolist() )
+
+        # random values are drawn for each replicate
+        model  = boolean2.Model( mode='sync', text='A* = Random' )
+        engine = batch.BitEngine( model, seed=2 )
+        avgs   = engine.averages( numpy.zeros( (6400, 1) ), steps=1 )
+        self.EQ( abs( avgs['A'][1] - 0.5 ) < 0.05, True )
+
+    def test_tables( self ):
+        "Testing the engines with truth table lookups"
+        for mode, klass in ( ( 'sync', batch.SyncEngine ), ( 'async', batch.AsyncEngine ) ):
+            model  = boolean2.Model( mode=mode, text=TEXT )
+            values = batch.all_states( len(model.nodes) )
+            plain  = klass( model, seed=3 ).iterate( values, steps=5 )
+            tables = klass( model, seed=3, tables=True ).iterate( values, steps=5 )
+            self.EQ( tables.tolist(), plain.tolist() )
+
+    def test_overrides( self ):
+        "Testing that overridden rules are rejected"
+        model = boolean2.Model( mode='sync', text=TEXT )
+        model.parser.RULE_AND = lambda a, b, p: a
+        self.assertRaises( util.BooleanError, batch.SyncEngine, model )
+
+def get_suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase( BatchTest )
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner( verbosity=2 ).run( get_suite() )  
@@ -0,0 +1,91 @@
+"""
+Testing the compiled rules
+"""
+import sys, unittest, random
+
+from tests import testbase
+
+import boolean2
+from boolean2 import util, compiler
+
+TEXT = """
+A = B = True
+C = Random
+1: A* = A or not C
+1: B* = A and B or Random
+1: C* = not (A and (B or C))
+1: D* = C or (1, 2, 1)
+"""
+
+def run( mode, compiled, hooks=False, seed=10, steps=20, tables=False ):
+    "Runs a model with the given settings, returns the binary states"
+    random.seed( seed )
+    model = boolean2.Model( mode=mode, text=TEXT )
+    model.COMPILE = compiled
+    model.TABLES = tables
+    if hooks:
+        model.parser.RULE_AND = lambda a, b, p: random.choice( (a and b, a, b) )
+        model.parser.RULE_GETVALUE = lambda state, name, p: getattr( state, name )
+    model.initialize( missing=util.randbool )
+    model.iterate( steps=steps )
+    return [ state.bin() for state in model.states ]
+
+class CompilerTest( testbase.TestBase ):
+
+    def test_parse( self ):
+        "Testing expression trees"
+        tokens = boolean2.tokenizer.tokenize( '1: A* = not A and B or C' )[0]
+        node, tree = compiler.parse_update( tokens )
+        self.EQ( node, 'A' )
+        self.EQ( tree, ('OR', ('AND', ('NOT', ('ID', 'A')), ('ID', 'B')), ('ID', 'C')) )
+        self.EQ( compiler.get_inputs( tree ), set( 'ABC' ) )
+
+    def test_lexers( self ):
+        "Testing that each lexer keeps its own input"
+        first, second = boolean2.tokenizer.get_lexer(), boolean2.tokenizer.get_lexer()
+        self.assertTrue( first.lexer is not second.lexer )
+        first.lexer.input( 'A* = B' )
+        second.lexer.input( 'C = True' )
+        self.EQ( first.lexer.token().value, 'A' )
+        self.EQ( second.lexer.token().value, 'C' )
+        self.EQ( [ t.value for t in first.tokenize_line( 'B = False' ) ], [ 'B', '=', 'False' ] )
+
+    def test_same_states( self ):
+        "Testing compiled rules against the parser"
+        for mode in ( 'sync', 'async' ):
+            for hooks in ( False, True ):
+                self.EQ( run( mode, True, hooks ), run( mode, False, hooks ) )
+
+    def test_truth_tables( self ):
+        "Testing the truth tables against the evaluated expressions"
+        rule = 'not (A and (B or C)) or (D and not A)'
+        tree = compiler.parse_expression( boolean2.tokenizer.tokenize( rule )[0] )
+        inputs, table = compiler.truth_table( tree )
+        self.EQ( inputs, list( 'ABCD' ) )
+        for row, value in enumerate( table ):
+            env = dict( zip( inputs, [ bool( row >> (3 - pos) & 1 ) for pos in range(4) ] ) )
+            self.EQ( value, eval( rule, env ) )
+        
+        self.EQ( compiler.truth_table( tree, limit=3 ), None )
+        random = compiler.parse_expression( boolean2.tokenizer.tokenize( 'A or Random' )[0] )
+        self.EQ( compiler.truth_table( random ), None )
+
+        # the compiled rules give the same states with table lookups
+        for mode in ( 'sync', 'async' ):
+            self.EQ( run( mode, True, tables=True ), run( mode, False ) )
+
+    def test_hook_changes( self ):
+        "Testing recompilation after changing the RULE_* functions"
+        model = boolean2.Model( mode='sync', text=TEXT )
+        model.initialize( missing=util.false )
+        model.parser.RULE_NOT = lambda a, p: False
+        model.iterate( steps=1 )
+        self.EQ( model.last.A, True )
+        self.EQ( model.last.C, False )
+
+def get_suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase( CompilerTest )
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner( verbosity=2 ).run( get_suite() )  
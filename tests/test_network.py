@@ -0,0 +1,142 @@
+"""
+Testing the transition graphs
+"""
+import sys, unittest, os, tempfile
+
+from tests import testbase
+
+import numpy
+import boolean2
+from boolean2 import util, network
+
+TEXT = """
+A = B = C = False
+D = True
+A* = C and (not B)
+B* = A
+C* = D
+D* = B or not C
+"""
+
+class NetworkTest( testbase.TestBase ):
+
+    def test_compact_graph( self ):
+        "Testing the compact transition graph against the regular one"
+        model = boolean2.Model( mode='async', text=TEXT )
+        trans = network.TransGraph( logfile=os.devnull )
+        other = network.CompactTransGraph( capacity=16 )
+        for index in range(50):
+            model.initialize( missing=util.randbool )
+            model.iterate( steps=10 )
+            trans.add( model.states )
+            other.add( model.states )
+
+        self.EQ( sorted( other.graph.edges() ), sorted( trans.graph.edges() ) )
+        self.EQ( len( other.edges() ), trans.graph.number_of_edges() )
+        self.EQ( sorted( other.store ), sorted( trans.store ) )
+
+    def test_compact_log( self ):
+        "Testing the log of the compact transition graph"
+        model = boolean2.Model( mode='sync', text=TEXT )
+        model.initialize()
+        model.iterate( steps=3 )
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join( tmpdir, 'trans.log' )
+            trans = network.CompactTransGraph( logfile=path, verbose=True )
+            trans.add( model.states, times=[ 0, 5, 10, 15 ] )
+            trans.fp.close()
+            lines = open( path ).read().splitlines()
+
+        names = [ state.bin() for state in model.states ]
+        self.EQ( lines[0], '*** transitions from %s ***' % names[0] )
+        self.EQ( lines[2], 'T=5: %s->%s' % ( names[1], names[2] ) )
+        self.EQ( len(lines), 4 )
+
+    def test_components( self ):
+        "Testing the strong components against networkx"
+        import networkx
+        model = boolean2.Model( mode='async', text=TEXT )
+        trans = network.CompactTransGraph()
+        for index in range(20):
+            model.initialize( missing=util.randbool )
+            model.iterate( steps=10 )
+            trans.add( model.states )
+        graph = trans.graph
+
+        def partition( colormap ):
+            groups = {}
+            for node, color in colormap.items():
+                groups.setdefault( color, set() ).add( node )
+            return sorted( map( sorted, groups.values() ) )
+        
+        expected = sorted( map( sorted, networkx.strongly_connected_components( graph ) ) )
+        self.EQ( partition( network.component_colormap( graph ) ), expected )
+        self.EQ( partition( trans.colormap() ), expected )
+        
+        count, labels = trans.components()
+        sizes = network.component_sizes( labels )
+        self.EQ( sum( size * number for size, number in sizes ), len(trans.keys) )
+        self.EQ( sum( number for size, number in sizes ), count )
+
+    def test_palette( self ):
+        "Testing the palette"
+        colors = network.palette( 1000 )
+        self.EQ( colors[:len(network.COLORS)], network.COLORS )
+        self.EQ( len( set( colors ) ), 1000 )
+        self.EQ( network.palette( 1000 ), colors )
+
+    def test_exporters( self ):
+        "Testing the streaming exporters"
+        import networkx
+        model = boolean2.Model( mode='async', text=TEXT )
+        trans = network.CompactTransGraph()
+        for index in range(20):
+            model.initialize( missing=util.randbool )
+            model.iterate( steps=10 )
+            trans.add( model.states )
+        graph = trans.graph
+        expected = sorted( ( str(a), str(b) ) for a, b in graph.edges() )
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join( tmpdir, 'graph' )
+            def read( func, *args, **kwds ):
+                func( *args, **kwds )
+                text = open( path ).read()
+                os.remove( path )
+                return text
+
+            # the random layout is reproducible
+            colormap = network.component_colormap( graph )
+            text = read( network.write_gml, graph, path, colormap=colormap, seed=1 )
+            self.EQ( read( network.write_gml, graph, path, colormap=colormap, seed=1 ), text )
+            self.EQ( read( trans.export, path, colormap=colormap, seed=1 ).count( 'edge [' ), len(expected) )
+            self.EQ( text.count( ' x ' ), len(graph) )
+            self.EQ( read( network.write_gml, graph, path, layout=False ).count( ' x ' ), 0 )
+        
+            network.write_gml( graph, path )
+            result = networkx.read_gml( path, label='label' )
+            self.EQ( sorted( result.edges() ), expected )
+
+            network.write_graphml( graph, path, colormap=colormap, seed=1 )
+            result = networkx.read_graphml( path )
+            self.EQ( sorted( result.edges() ), expected )
+            node = list( graph.nodes() )[0]
+            self.EQ( result.nodes[ str(node) ]['color'], colormap.get( node, '#CCCCFF' ) )
+            self.EQ( 'x' in result.nodes[ str(node) ], True )
+            self.EQ( read( network.write_graphml, graph, path, layout=False ).count( 'key="x"' ), 0 )
+
+            lines = read( trans.save_edges, path ).splitlines()
+            self.EQ( sorted( tuple( line.split(',') ) for line in lines ), expected )
+
+            trans.save_edges( path, binary=True )
+            pairs = numpy.fromfile( path, dtype='<i8' ).reshape( -1, 2 )
+            os.remove( path )
+            self.EQ( pairs.tolist(), trans.edges().tolist() )
+
+def get_suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase( NetworkTest )
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner( verbosity=2 ).run( get_suite() )  
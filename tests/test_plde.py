@@ -0,0 +1,184 @@
+"""
+Testing the piecewise linear differential equations
+"""
+import sys, os, tempfile, unittest
+
+from tests import testbase
+
+import numpy
+import boolean2
+from boolean2 import util
+from boolean2.plde import integrate, helper, runner, model as pldemodel
+
+TEXT = """
+A = B = (1, 1, 0.5)
+C = (0, 1, 0.5)
+1: A* = not C
+2: B* = A and B
+3: C* = B
+"""
+
+def noisy_override( node, indexer, tokens ):
+    "The scans look up the rates from the rows and draw random values"
+    if node == 'C':
+        return '%s = %s * random.random() * ( %s )' % ( helper.change( node, indexer ), helper.Symbols( 'par' )[node]['rate'], helper.piecewise( tokens, indexer ) )
+
+def noisy_initializer( row ):
+    return helper.initializer( row, default=(1, 1, 0.5) )
+
+def noisy_setup( model ):
+    model.EXTRA_INIT = 'import random'
+    model.OVERRIDE = noisy_override
+
+class PldeTest( testbase.TestBase ):
+
+    def test_integrators( self ):
+        "Testing the integrators on a harmonic oscillator"
+        t = numpy.linspace( 0, 10, 201 )
+        derivs = lambda x, t: ( x[1], -x[0] )
+        for method in integrate.METHODS:
+            values = integrate.integrate( derivs, [ 1.0, 0.0 ], t, method=method, **( method == integrate.RK45 and dict( rtol=1e-8, atol=1e-10 ) or {} ) )
+            self.EQ( values.shape, ( 201, 2 ) )
+            self.assertTrue( numpy.allclose( values[:, 0], numpy.cos( t ), atol=1e-6 ) )
+
+        # a batch of states integrates at once
+        values = integrate.rk45( lambda x, t: -x, numpy.ones( (3, 4) ), t )
+        self.EQ( values.shape, ( 201, 3, 4 ) )
+
+        self.assertRaises( util.BooleanError, integrate.integrate, derivs, [ 1.0, 0.0 ], t, method='euler' )
+        self.assertRaises( util.BooleanError, integrate.rk4, derivs, [ 1.0, 0.0 ], [ 1, 0 ] )
+
+    def test_minimal_step( self ):
+        "Testing the steps through a node that switches itself"
+        derivs = integrate.Counter( lambda x, t: float( not x[0] > 0.5 ) - x )
+        values = integrate.rk45( derivs, [ 1.0 ], numpy.linspace( 0, 5, 51 ), hmin=0.01 )
+        self.assertTrue( abs( values[-1, 0] - 0.5 ) < 0.05 )
+        self.assertTrue( derivs.calls < 7 * 500 )
+
+    def test_model( self ):
+        "Testing the adaptive integration of a model against fine fixed steps"
+        model = boolean2.Model( mode='plde', text=TEXT )
+        model.initialize()
+        model.iterate( fullt=7, steps=7000 )
+        expected = dict( ( node, values[::100] ) for node, values in model.data.items() )
+
+        model.iterate( fullt=7, steps=70, method='rk45' )
+        self.EQ( len( model.data['A'] ), 70 )
+        for node in model.nodes:
+            self.assertTrue( numpy.allclose( model.data[node], expected[node], atol=1e-3 ) )
+
+    def test_compiled_code( self ):
+        "Testing the in memory compilation of the generated code"
+        model = boolean2.Model( mode='plde', text=TEXT )
+        model.initialize()
+        model.iterate( fullt=1, steps=10 )
+        first = model.derivs
+        self.assertTrue( first.__code__.co_filename in [ code.co_filename for code in pldemodel.CODE_CACHE.values() ] )
+        self.assertFalse( os.path.exists( 'autogen.py' ) )
+
+        # the same code is not compiled again
+        size = len( pldemodel.CODE_CACHE )
+        model.iterate( fullt=1, steps=10 )
+        self.EQ( len( pldemodel.CODE_CACHE ), size )
+        self.EQ( model.derivs.__code__, first.__code__ )
+
+        # the code may be written out for debugging
+        with tempfile.TemporaryDirectory() as dirname:
+            name = os.path.join( dirname, 'generated' )
+            model.iterate( fullt=1, steps=10, autogen=name )
+            self.EQ( open( name + '.py' ).read().strip(), model.dynamic_code.strip() )
+
+        model.OVERRIDE = lambda node, indexer, tokens: node == 'A' and 'n0 = (' or None
+        self.assertRaises( util.BooleanError, model.iterate, fullt=1, steps=2 )
+
+    def test_vector_code( self ):
+        "Testing the vector code against the scalar code"
+        text = TEXT + "4: D* = not (C or B) and True"
+        model = boolean2.Model( mode='plde', text=text )
+        model.initialize( missing=util.true )
+        model.iterate( fullt=3, steps=30 )
+        expected = model.alldata.copy()
+
+        model.iterate( fullt=3, steps=30, vector=True )
+        self.assertTrue( numpy.allclose( model.alldata, expected ) )
+
+        # the replicates are integrated together
+        rng = numpy.random.RandomState( 3 )
+        starts = rng.rand( 5, 4 )
+        model.iterate( fullt=3, steps=30, starts=starts )
+        self.EQ( model.alldata.shape, ( 30, 5, 4 ) )
+        self.EQ( len( model.data['A'][0] ), 5 )
+        scalar = boolean2.Model( mode='plde', text=text )
+        for pos, values in enumerate( starts ):
+            params = dict( ( node, ( value, 1, 0.5 ) ) for node, value in zip( model.nodes, values ) )
+            scalar.initialize( missing=util.true, defaults=params )
+            scalar.iterate( fullt=3, steps=30 )
+            self.assertTrue( numpy.allclose( model.alldata[:, pos], scalar.alldata ) )
+
+    def test_sweep( self ):
+        "Testing the parameter sweeps with the same compiled code"
+        rng = numpy.random.RandomState( 7 )
+        rows = []
+        for pos in range( 4 ):
+            rows.append( dict( ( node, dict( conc=rng.rand(), decay=1 + rng.rand(), threshold=0.5, rate=rng.rand() ) ) for node in 'ABC' ) )
+
+        # the rate of C is looked up from the row when the code runs
+        def override( node, indexer, tokens, par=helper.Symbols( 'par' ), piecewise=helper.piecewise ):
+            if node == 'C':
+                return '%s = %s * ( %s )' % ( helper.change( node, indexer ), par[node]['rate'], piecewise( tokens, indexer ) )
+        model = boolean2.Model( mode='plde', text=TEXT )
+        model.OVERRIDE = override
+
+        size = len( pldemodel.CODE_CACHE )
+        values = model.sweep( fullt=3, steps=30, rows=rows )
+        self.EQ( values.shape, ( 4, 30, 3 ) )
+        self.assertTrue( len( pldemodel.CODE_CACHE ) <= size + 1 )
+
+        for row, expected in zip( rows, values ):
+            baked = boolean2.Model( mode='plde', text=TEXT )
+            baked.OVERRIDE = lambda node, indexer, tokens: override( node, indexer, tokens, par=row )
+            baked.initialize( missing=helper.initializer( row ) )
+            baked.iterate( fullt=3, steps=30 )
+            self.assertTrue( numpy.allclose( baked.alldata, expected ) )
+
+        # the rows may be integrated together
+        model.OVERRIDE = lambda node, indexer, tokens: override( node, indexer, tokens, piecewise=helper.vector_piecewise )
+        batch = model.sweep( fullt=3, steps=30, rows=rows, vector=True )
+        self.assertTrue( numpy.allclose( batch, values ) )
+
+    def test_scan( self ):
+        "Testing the parameter scans in a pool of processes"
+        rows = [ dict( C=dict( conc=0, decay=1, threshold=0.5, rate=rate ) ) for rate in ( 0.5, 1, 2 ) ]
+        texts = dict( WT=TEXT, B=boolean2.modify_states( TEXT, turnoff=[ 'B' ] ) )
+        starts = [ {}, dict( A=( 0.0, 1, 0.5 ) ) ]
+        scan = runner.Scan( texts, rows, fullt=2, steps=20, starts=starts, initializer=noisy_initializer, setup=noisy_setup )
+        self.EQ( len( scan.jobs() ), 12 )
+
+        with tempfile.TemporaryDirectory() as dirname:
+            fname = os.path.join( dirname, 'scan.npy' )
+            values, index = scan.execute( fname, processes=1 )
+            self.EQ( values.shape, ( 12, 20, 3 ) )
+            self.assertTrue( numpy.all( index['evaluations'] == 4 * 19 ) )
+
+            # a job gives the same values when it runs on its own
+            job = index[7]
+            self.EQ( ( job['text'], job['row'], job['start'] ), ( 1, 0, 1 ) )
+            self.assertTrue( numpy.array_equal( scan.run( scan.model( job['text'] ), job ), values[7] ) )
+
+            # or in other processes
+            other = os.path.join( dirname, 'other.npy' )
+            pooled, table = scan.execute( other, processes=2 )
+            self.assertTrue( numpy.array_equal( pooled, values ) )
+
+            loaded, table, nodes, names = runner.load( other )
+            self.assertTrue( numpy.array_equal( loaded, values ) )
+            self.assertTrue( numpy.array_equal( table, index ) )
+            self.EQ( ( nodes, names ), ( [ 'A', 'B', 'C' ], [ 'WT', 'B' ] ) )
+            del values, pooled, loaded
+
+def get_suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase( PldeTest )
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner( verbosity=2 ).run( get_suite() )  
@@ -0,0 +1,96 @@
+"""
+Testing the network reduction
+"""
+import sys, unittest
+
+from tests import testbase
+
+import boolean2
+from boolean2 import util, reduction, tokenizer
+
+TEXT = """
+IN = True
+A = B = C = False
+D = E = F = True
+A* = IN and not C
+B* = not IN or C
+C* = B and D
+D* = A or B
+E* = not F and E
+F* = D or E
+"""
+
+def full_states( text, steps, mode='sync' ):
+    model = boolean2.Model( mode=mode, text=text )
+    model.initialize( missing=util.false )
+    model.iterate( steps=steps )
+    return [ state.bin() for state in model.states ]
+
+class ReductionTest( testbase.TestBase ):
+
+    def test_propagation( self ):
+        "Testing the constant propagation"
+        model = boolean2.Model( mode='sync', text=TEXT )
+        red = reduction.Reduction( model )
+        self.EQ( sorted( red.fixed.items() ), [ ('B', False), ('C', False), ('IN', True) ] )
+        self.EQ( red.nodes, [ 'A', 'D', 'E', 'F' ] )
+        self.EQ( 'B' in red.text, False )
+        self.EQ( red.report(), 'reduced 7 nodes to 4, fixed nodes: B=False, C=False, IN=True' )
+
+        small = red.reduced()
+        small.initialize()
+        small.iterate( steps=10 )
+        self.EQ( [ state.bin() for state in red.expand_states( small.states ) ], full_states( TEXT, 10 ) )
+        self.EQ( red.expand( small.last ).bin(), full_states( TEXT, 10 )[-1] )
+
+    def test_knockouts( self ):
+        "Testing the knockouts against the modified rules"
+        for on, off in ( ( [], [ 'D' ] ), ( [ 'C' ], [] ), ( [ 'C' ], [ 'IN' ] ) ):
+            model = boolean2.Model( mode='sync', text=TEXT )
+            red = reduction.Reduction( model, fixed=dict( [ (n, True) for n in on ] + [ (n, False) for n in off ] ) )
+            small = red.reduced()
+            small.initialize()
+            small.iterate( steps=8 )
+            text = tokenizer.modify_states( TEXT, turnon=on, turnoff=off )
+            self.EQ( [ state.bin() for state in red.expand_states( small.states ) ], full_states( text, 8 ) )
+
+    def test_free_inputs( self ):
+        "Testing the inputs without initial values that only feed frozen nodes"
+        text = 'IN = B = True\nC = False\nB* = IN or X\nC* = C and X'
+        model = boolean2.Model( mode='sync', text=text )
+        red = reduction.Reduction( model )
+        self.EQ( red.nodes, [ 'X' ] )
+        small = red.reduced()
+        self.EQ( sorted( small.nodes ), red.nodes )
+        for missing in ( util.false, util.true ):
+            small.initialize( missing=missing )
+            small.iterate( steps=3 )
+            model.initialize( missing=missing )
+            model.iterate( steps=3 )
+            self.EQ( [ state.bin() for state in red.expand_states( small.states ) ], [ state.bin() for state in model.states ] )
+
+    def test_text( self ):
+        "Testing the text of the trees"
+        for rule in ( 'A and (B or C)', 'not (A and B) or C and not D', '(A or B) and (C or D) and E', 'A or (B or C)' ):
+            tree = reduction.compiler.parse_expression( tokenizer.tokenize( rule )[0] )
+            text = reduction.tree_text( tree )
+            self.EQ( reduction.compiler.parse_expression( tokenizer.tokenize( text )[0] ), tree )
+
+    def test_expand_values( self ):
+        "Testing the expansion of the batch results"
+        import numpy
+        from boolean2 import batch
+        model = boolean2.Model( mode='sync', text=TEXT )
+        red = reduction.Reduction( model )
+        small = red.reduced()
+        values = batch.all_states( len(small.nodes) )
+        traj = red.expand_values( batch.SyncEngine( small ).iterate( values, steps=4 ) )
+        full = red.expand_values( values )
+        self.EQ( traj.tolist(), batch.SyncEngine( model ).iterate( full, steps=4 ).tolist() )
+
+def get_suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase( ReductionTest )
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner( verbosity=2 ).run( get_suite() )  
@@ -0,0 +1,125 @@
+"""
+Testing the exhaustive state space analysis
+"""
+import sys, unittest
+
+from tests import testbase
+
+import numpy
+import boolean2
+from boolean2 import util, statespace
+
+TEXT = """
+B* = A or C
+C* = A and not D
+D* = B and C
+E* = not (D or E)
+A* = A
+"""
+
+class StateSpaceTest( testbase.TestBase ):
+
+    def test_transitions( self ):
+        "Testing the transition table against the regular engine"
+        model = boolean2.Model( mode='sync', text=TEXT )
+        space = statespace.StateSpace( model, chunk=7 )
+        self.EQ( len(space.table), 32 )
+        for code, state in enumerate( space.states( numpy.arange(32) ) ):
+            self.EQ( state.fp(), code )
+            model.initialize( missing=util.false, defaults=dict( state.items() ) )
+            model.iterate( steps=1 )
+            self.EQ( int(space.table[code]), model.last.fp() )
+
+    def test_attractors( self ):
+        "Testing the attractors and basins against the online detection"
+        model = boolean2.Model( mode='sync', text=TEXT )
+        space = statespace.StateSpace( model )
+        cycles, basins = space.attractors(), space.basins()
+        self.EQ( space.basin_sizes().sum(), 32 )
+        for code, state in enumerate( space.states( numpy.arange(32) ) ):
+            model.initialize( missing=util.false, defaults=dict( state.items() ) )
+            index, size, cycle = model.iterate( steps=40, until='attractor' )
+            self.EQ( sorted( s.fp() for s in cycle ), sorted( cycles[ basins[code] ] ) )
+
+    def test_functional_cycles( self ):
+        "Testing the cycle detection on a functional graph"
+        succ = numpy.array( [ 3, 0, 1, 4, 3, 5, 5 ] )
+        cycles, labels = statespace.functional_cycles( succ )
+        self.EQ( cycles, [ [3, 4], [5] ] )
+        self.EQ( labels.tolist(), [ 0, 0, 0, 0, 0, 1, 1 ] )
+
+    def test_async_transitions( self ):
+        "Testing the asynchronous successors against single rule updates"
+        model = boolean2.Model( mode='async', text=TEXT )
+        space = statespace.AsyncStateSpace( model, chunk=5 )
+        self.EQ( len(space.indptr), 33 )
+        for code, state in enumerate( space.states( numpy.arange(32) ) ):
+            expected = set()
+            for line in model.update_lines[1]:
+                model.initialize( missing=util.false, defaults=dict( state.items() ) )
+                model.iterate( steps=1, shuffler=lambda lines: [ line ] )
+                if model.last != state:
+                    expected.add( model.last.fp() )
+            self.EQ( sorted( space.successors( code ).tolist() ), sorted( expected ) )
+
+    def test_async_attractors( self ):
+        "Testing the terminal components against networkx"
+        import networkx
+        model = boolean2.Model( mode='async', text=TEXT )
+        space = statespace.AsyncStateSpace( model )
+
+        graph = networkx.DiGraph()
+        graph.add_nodes_from( range(32) )
+        for code in range(32):
+            for other in space.successors( code ).tolist():
+                graph.add_edge( code, other )
+        cond = networkx.condensation( graph )
+        expected = [ sorted( cond.nodes[comp]['members'] ) for comp in cond if cond.out_degree( comp ) == 0 ]
+        self.EQ( space.attractors(), sorted( expected ) )
+        self.EQ( space.components()[0], len(cond) )
+
+    def test_modular_attractors( self ):
+        "Testing the modular attractors against the full state space"
+        rng = numpy.random.RandomState( 5 )
+        names = 'ABCDEFGHIJKL'
+        for round in range( 20 ):
+            lines = []
+            for pos, node in enumerate( names ):
+                # mostly feed forward rules with a few feedback loops
+                first, second = rng.randint( 0, pos+2, size=2 ) % len(names)
+                oper = rng.choice( [ 'and', 'or', 'and not' ] )
+                lines.append( '%s* = %s %s %s' % ( node, names[first], oper, names[second] ) )
+            text = '\n'.join( lines )
+            model = boolean2.Model( mode='sync', text=text )
+            modular = statespace.ModularStateSpace( model )
+            self.EQ( modular.attractors(), statespace.StateSpace( model ).attractors() )
+
+    def test_modular_size( self ):
+        "Testing the modular attractors beyond the size of the state space"
+        lines = [ 'N0* = not N0' ] + [ 'N%d* = N%d' % ( pos, pos-1 ) for pos in range( 1, 40 ) ]
+        model = boolean2.Model( mode='sync', text='\n'.join( lines ) )
+        self.assertRaises( util.BooleanError, statespace.StateSpace, model )
+        space = statespace.ModularStateSpace( model )
+        self.EQ( len( space.modules ), 40 )
+        cycles = space.attractors()
+        self.EQ( [ len(cycle) for cycle in cycles ], [ 2 ] )
+        first, second = space.states( cycles[0] )
+        self.EQ( [ first[node] for node in model.nodes ], [ not second[node] for node in model.nodes ] )
+
+    def test_errors( self ):
+        "Testing the unsupported models"
+        model = boolean2.Model( mode='async', text=TEXT )
+        self.assertRaises( util.BooleanError, statespace.StateSpace, model )
+        model = boolean2.Model( mode='sync', text='A* = A and Random' )
+        self.assertRaises( util.BooleanError, statespace.StateSpace, model )
+        self.assertRaises( util.BooleanError, statespace.ModularStateSpace, model )
+        model = boolean2.Model( mode='sync', text='A* = B\n B* = C\n C* = A' )
+        space = statespace.ModularStateSpace( model, limit=4 )
+        self.assertRaises( util.BooleanError, space.attractors )
+
+def get_suite():
+    suite = unittest.TestLoader().loadTestsFromTestCase( StateSpaceTest )
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner( verbosity=2 ).run( get_suite() )  
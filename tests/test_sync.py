@@ -1,14 +1,14 @@
 """
 Testing the synchronous model
 """
-import sys, unittest, string
+import sys, os, tempfile, unittest, string
 from random import randint, choice
 from itertools import *
 
 from tests import testbase
 
 import boolean2
-from boolean2 import util
+from boolean2 import util, state
             
 class SyncTest( testbase.TestBase ):
     
@@ -50,6 +50,250 @@ class SyncTest( testbase.TestBase ):
         self.EQ( model.first.C, False )
         self.EQ( len(model.states), 11)
 
+    def test_indexed_states( self ):
+        "Testing the array backed states"
+        
+        text = """
+        A = B = True
+        C = False
+        1: A* = A
+        2: B* = A and B
+        3: C* = not C
+        """
+        model  = boolean2.Model( mode='sync', text=text )
+        model.initialize()
+        model.iterate( steps=1 )
+
+        first, last = model.first, model.last
+        self.EQ( (first.A, first['C']), (True, False) )
+        self.EQ( list(last.keys()), [ 'A', 'B', 'C' ] )
+        self.EQ( last.bin(), '111' )
+        self.EQ( first.layout, last.layout )
+
+        # copies are independent
+        state = last.copy()
+        state.C = False
+        self.EQ( (state.C, last.C), (False, True) )
+        self.assertRaises( AttributeError, getattr, state, 'D' )
+
+    def test_fingerprints( self ):
+        "Testing the state fingerprints and labels"
+        
+        text = """
+        A = B = True
+        C = False
+        1: A* = A
+        2: B* = A and B
+        3: C* = not C
+        """
+        model = boolean2.Model( mode='sync', text=text )
+        model.initialize()
+        model.iterate( steps=3 )
+
+        # fingerprints are the binary codes of the states
+        self.EQ( model.fp(), [ 6, 7, 6, 7 ] )
+        self.EQ( model.fp(), [ int( s.bin(), 2 ) for s in model.states ] )
+        self.EQ( model.detect_cycles(), (0, 2) )
+
+        # labels are numbered by the order of appearance in each model
+        other = model.clone()
+        self.EQ( [ model.labels( s ) for s in model.states ], [ 0, 1, 0, 1 ] )
+        self.EQ( ( len(model.labels), len(other.labels) ), ( 2, 0 ) )
+
+        labels = state.Labels( limit=1 )
+        labels( model.first )
+        self.assertRaises( util.BooleanError, labels, model.last )
+
+        # the saved states are identified by the fingerprints
+        with tempfile.TemporaryDirectory() as dirname:
+            fname = os.path.join( dirname, 'states.txt' )
+            model.save_states( fname )
+            lines = open( fname ).read().splitlines()
+        self.EQ( [ int( line.split()[0] ) for line in lines[1:] ], model.fp() )
+
+    def test_model_cache( self ):
+        "Testing the model cache"
+        
+        text = """
+        A = B = True
+        C = False
+        1: A* = A
+        2: B* = A and B
+        3: C* = not C
+        """
+        cache = boolean2.ModelCache( maxsize=1 )
+        
+        # spacing and comments do not change the key
+        model1 = boolean2.Model( mode='sync', text=text, cache=cache )
+        model2 = boolean2.Model( mode='sync', text=text.replace( '=', ' = ' ) + '# comment', cache=cache )
+        self.EQ( cache.stats(), dict( hits=1, misses=1, size=1, maxsize=1 ) )
+
+        # the copies are independent
+        model1.parser.RULE_NOT = lambda a, p: True
+        for model in ( model1, model2 ):
+            model.initialize()
+            model.iterate( steps=1 )
+        self.EQ( ( model1.last.C, model2.last.C ), ( True, True ) )
+        model1.iterate( steps=1 )
+        model2.iterate( steps=1 )
+        self.EQ( ( model1.last.C, model2.last.C ), ( True, False ) )
+        self.EQ( len(model2.states), 3 )
+        
+        # least recently used models are evicted
+        boolean2.Model( mode='async', text=text, cache=cache )
+        self.EQ( cache.stats(), dict( hits=1, misses=2, size=1, maxsize=1 ) )
+
+    def test_reset( self ):
+        "Testing resets to new initial values"
+        
+        text = """
+        A = True
+        1: A* = A
+        1: B* = A and B
+        1: C* = not C
+        """
+        model = boolean2.Model( mode='sync', text=text )
+        model.initialize( missing=util.false )
+        
+        # partial values keep the initialized nodes
+        model.reset( dict( B=True ) )
+        model.iterate( steps=2 )
+        self.EQ( [ s.bin() for s in model.states ], [ '110', '111', '110' ] )
+
+        # full vectors replace the state
+        model.reset( [ False, True, True ] )
+        self.EQ( model.first.bin(), '011' )
+        self.assertRaises( util.BooleanError, model.reset, [ True ] )
+
+        # batched resets
+        vectors = [ [ True, True, False ], [ False, False, False ] ]
+        lasts = []
+        for run in model.resets( vectors ):
+            run.iterate( steps=1 )
+            lasts.append( run.last.bin() )
+        self.EQ( lasts, [ '111', '001' ] )
+
+        # clones are initialized separately
+        other = model.clone()
+        other.initialize( missing=util.true )
+        self.EQ( ( model.initial.bin(), other.initial.bin() ), ( '100', '111' ) )
+
+    def test_recording( self ):
+        "Testing the state recording policies"
+        
+        text = """
+        A = B = C = False
+        1: A* = not A
+        1: B* = A
+        1: C* = B
+        """
+        model = boolean2.Model( mode='sync', text=text )
+        model.initialize()
+        model.iterate( steps=6 )
+        full = [ s.bin() for s in model.states ]
+
+        model.reset()
+        stream = [ s.bin() for s in model.iterate_stream( steps=6 ) ]
+        self.EQ( stream, full[1:] )
+        self.EQ( len(model.states), 1 )
+
+        model.reset()
+        model.iterate( steps=6, every=2 )
+        self.EQ( [ s.bin() for s in model.states ], full[::2] )
+
+        model.reset()
+        model.iterate( steps=6, last=3 )
+        self.EQ( [ s.bin() for s in model.states ], full[-3:] )
+
+        model.reset()
+        model.iterate( steps=6, nodes=[ 'C', 'A' ] )
+        self.EQ( list(model.last.keys()), [ 'A', 'C' ] )
+        self.EQ( [ s.bin() for s in model.states ], [ x[0] + x[2] for x in full ] )
+        self.EQ( model.data['C'], [ x[2] == '1' for x in full ] )
+
+    def test_attractor_detection( self ):
+        "Testing early termination at attractors"
+        
+        text = """
+        A = B = C = False
+        1: A* = not A
+        1: B* = A
+        1: C* = C or B
+        """
+        model = boolean2.Model( mode='sync', text=text )
+        model.initialize()
+        index, size, cycle = model.iterate( steps=100, until='attractor' )
+        self.EQ( ( index, size ), ( 3, 2 ) )
+        self.EQ( [ s.bin() for s in cycle ], [ '101', '011' ] )
+        self.EQ( len(model.states), 6 )
+        
+        # the same answer as the offline detection over a longer run
+        model.reset()
+        model.iterate( steps=10 )
+        self.EQ( util.detect_cycles( [ s.bin() for s in model.states ] ), ( index, size ) )
+
+        # not enough steps
+        model.reset()
+        self.EQ( model.iterate( steps=2, until='attractor' ), ( 0, 0, [] ) )
+
+        model = boolean2.Model( mode='async', text=text )
+        model.initialize()
+        self.assertRaises( util.BooleanError, model.iterate, steps=10, until='attractor' )
+
+        # random rules do not have unique successors
+        model = boolean2.Model( mode='sync', text='A = B = False\n A* = Random\n B* = A' )
+        model.initialize()
+        self.assertRaises( util.BooleanError, model.iterate, steps=100, until='attractor' )
+
+    def test_incremental( self ):
+        "Testing the incremental synchronous updates"
+        
+        text = """
+        A = B = True
+        C = D = E = False
+        A* = not E
+        B* = A and B
+        C* = B or C
+        D* = A and not C
+        E* = D
+        F* = True
+        """
+        def run( incremental, steps=12 ):
+            model = boolean2.Model( mode='sync', text=text )
+            model.INCREMENTAL = incremental
+            model.initialize( missing=util.false )
+            model.iterate( steps=steps )
+            return model, [ s.bin() for s in model.states ]
+        
+        model, states = run( True )
+        self.EQ( states, run( False )[1] )
+        self.EQ( model.incremental(), True )
+        self.EQ( model.changed, [] )
+
+        # steps after a reset start with all rules
+        model.reset()
+        model.iterate( steps=12 )
+        self.EQ( [ s.bin() for s in model.states ], states )
+
+        # edits of the state between the iterations are seen
+        text2 = 'A = B = False\n A* = A\n B* = A'
+        results = []
+        for incremental in ( True, False ):
+            model = boolean2.Model( mode='sync', text=text2 )
+            model.INCREMENTAL = incremental
+            model.initialize()
+            model.iterate( steps=3 )
+            model.last.A = True
+            model.iterate( steps=2 )
+            results.append( [ s.bin() for s in model.states[-3:] ] )
+        self.EQ( results[0], [ '10', '11', '11' ] )
+        self.EQ( results[0], results[1] )
+
+        # a node with more than one rule needs the full updates
+        model = boolean2.Model( mode='sync', text=text + 'F* = A' )
+        model.INCREMENTAL = True
+        self.EQ( model.incremental(), False )
+
     def test_modeline( self ):
         "Basic operation"
         